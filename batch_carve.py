@@ -0,0 +1,297 @@
+"""
+
+Carving many images in one run. Jobs come from a directory (every image in it,
+with the same operation) or from a JSON or CSV manifest, and run on a pool of
+long-lived worker processes, so that Python, NumPy and PIL are started once per
+worker instead of once per image. A result and timing record is written for
+every job, as JSON lines or CSV.
+
+A job has the fields:
+
+  - 'input': the input image, and 'output': the output image (by default the
+    input's file name inside the output directory),
+  - 'operation': 'width' or 'height' to remove vertical or horizontal seams, or
+    'object' to remove the object in a box,
+  - 'seams': the number of seams to remove, or 'width' / 'height': the size to
+    carve the image down to (for the 'width' and 'height' operations),
+  - 'row1', 'row2', 'col1', 'col2': the box of the object (for 'object'),
+  - 'seams_per_pass' and 'pyramid_levels' (optional): the approximate modes of
+    'carving.carve_seams' (for the 'width' and 'height' operations; an object
+    is removed like 'remove_object.py' removes it, until none of the box is left),
+  - 'energy' (optional): the energy function, one of 'energy_image.ENERGY_FUNCTIONS'.
+
+A JSON manifest is a list of jobs (or an object with a "jobs" list), and a CSV
+manifest has a header row with the field names.
+
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from carving import carve_seams
+from energy_image import DEFAULT_ENERGY, ENERGY_FUNCTIONS, add_energy_argument
+from remove_object import box_mask, remove_object_mask
+from snapshots import SeamSnapshots
+from utils import read_image, write_image
+
+
+OPERATIONS = ('width', 'height', 'object')
+
+IMAGE_EXTENSIONS = ('.bmp', '.gif', '.jpeg', '.jpg', '.png', '.tif', '.tiff', '.webp')
+
+# The fields of a result record, in the order they are written
+RESULT_FIELDS = (
+    'job', 'input', 'output', 'operation', 'seams', 'status', 'error',
+    'input_width', 'input_height', 'output_width', 'output_height',
+    'read_seconds', 'carve_seconds', 'write_seconds', 'total_seconds',
+)
+
+# The job fields that hold whole numbers
+INTEGER_FIELDS = ('seams', 'width', 'height', 'row1', 'row2', 'col1', 'col2', 'seams_per_pass', 'pyramid_levels')
+
+
+def jobs_from_directory(directory, output_dir, operation, **fields):
+    """
+    One job per image in the given directory, all with the same operation and
+    fields, writing into 'output_dir' under the same file names.
+
+    """
+    jobs = []
+    for name in sorted(os.listdir(directory)):
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+            jobs.append(dict(fields, input=os.path.join(directory, name),
+                             output=os.path.join(output_dir, name), operation=operation))
+
+    return jobs
+
+
+def jobs_from_manifest(filename, output_dir=None):
+    """
+    Read the jobs of a JSON or CSV manifest. Relative input and output paths
+    are taken relative to the manifest, and jobs without an output write into
+    'output_dir'.
+
+    """
+    with open(filename, newline='') as manifest:
+        if filename.lower().endswith('.csv'):
+            # Empty cells are left out, so that they fall back to the defaults like missing keys do
+            jobs = [{key: value for key, value in row.items() if value not in (None, '')}
+                    for row in csv.DictReader(manifest)]
+        else:
+            jobs = json.load(manifest)
+            if isinstance(jobs, dict):
+                jobs = jobs['jobs']
+
+    base = os.path.dirname(os.path.abspath(filename))
+    for job in jobs:
+        job['input'] = os.path.join(base, job['input'])
+        if job.get('output'):
+            job['output'] = os.path.join(base, job['output'])
+        elif output_dir is not None:
+            job['output'] = os.path.join(output_dir, os.path.basename(job['input']))
+
+    return jobs
+
+
+def _prepare_job(job):
+    """
+    Check the fields of a job and convert them to numbers.
+
+    """
+    job = dict(job)
+    for field in INTEGER_FIELDS:
+        if job.get(field) is not None:
+            job[field] = int(job[field])
+
+    if job.get('operation') not in OPERATIONS:
+        raise ValueError(f'Unknown operation {job.get("operation")!r}, expected one of {OPERATIONS}')
+    if not job.get('output'):
+        raise ValueError('The job has no output (and no output directory was given)')
+    if job.get('seams_per_pass') is not None and job['seams_per_pass'] < 1:
+        raise ValueError(f'seams_per_pass must be at least 1, got {job["seams_per_pass"]}')
+    if job.get('pyramid_levels') is not None and job['pyramid_levels'] < 0:
+        raise ValueError(f'pyramid_levels must be at least 0, got {job["pyramid_levels"]}')
+    if job.get('energy', DEFAULT_ENERGY) not in ENERGY_FUNCTIONS:
+        raise ValueError(f'Unknown energy {job["energy"]!r}, expected one of {", ".join(ENERGY_FUNCTIONS)}')
+
+    if job['operation'] == 'object':
+        missing = [field for field in ('row1', 'row2', 'col1', 'col2') if job.get(field) is None]
+        if missing:
+            raise ValueError(f'The object box is missing {", ".join(missing)}')
+    elif job.get('seams') is None and job.get(job['operation']) is None:
+        raise ValueError(f'The job needs either a number of seams or a target {job["operation"]}')
+
+    return job
+
+
+def run_job(job):
+    """
+    Run a single job and return its result record. Errors are recorded instead
+    of raised, so one bad image does not stop the batch.
+
+    """
+    record = dict.fromkeys(RESULT_FIELDS)
+    record.update(job=job.get('job'), input=job.get('input'), output=job.get('output'),
+                  operation=job.get('operation'))
+    started = time.perf_counter()
+
+    try:
+        job = _prepare_job(job)
+
+        pixels = read_image(job['input'])
+        record['input_height'], record['input_width'] = pixels.shape[:2]
+        read_done = time.perf_counter()
+        record['read_seconds'] = read_done - started
+
+        operation = job['operation']
+        energy_function = job.get('energy') or DEFAULT_ENERGY
+        if operation == 'object':
+            # Removed like 'remove_object.py' removes the same box: until none of it is left
+            rows, cols = pixels.shape[:2]
+            if not (0 <= job['row1'] <= job['row2'] < rows and 0 <= job['col1'] <= job['col2'] < cols):
+                raise ValueError(f'The object box is not inside the {cols}x{rows} image')
+            mask = box_mask(pixels.shape, job['row1'], job['row2'], job['col1'], job['col2'])
+            carved, vertical = remove_object_mask(pixels, mask, snapshots=SeamSnapshots('off'), verbose=False,
+                                                  energy_function=energy_function)
+            record['seams'] = pixels.shape[1 if vertical else 0] - carved.shape[1 if vertical else 0]
+        else:
+            if job.get('seams') is not None:
+                num_seams = job['seams']
+            else:
+                current = record['input_width'] if operation == 'width' else record['input_height']
+                num_seams = current - job[operation]
+
+            size = record['input_height'] if operation == 'height' else record['input_width']
+            if not 0 <= num_seams < size:
+                raise ValueError(f'Cannot remove {num_seams} seams from an image that is {size} pixels across')
+            record['seams'] = num_seams
+
+            carved, _ = carve_seams(
+                pixels, num_seams, vertical=operation != 'height', snapshots=SeamSnapshots('off'),
+                seams_per_pass=job.get('seams_per_pass') or 1, pyramid_levels=job.get('pyramid_levels') or 0,
+                verbose=False, energy_function=energy_function
+            )
+        carve_done = time.perf_counter()
+        record['carve_seconds'] = carve_done - read_done
+
+        output_dir = os.path.dirname(job['output'])
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        write_image(carved, job['output'])
+        record['output_height'], record['output_width'] = carved.shape[:2]
+        record['write_seconds'] = time.perf_counter() - carve_done
+
+        record['status'] = 'ok'
+    except Exception as error:
+        record['status'] = 'error'
+        record['error'] = f'{type(error).__name__}: {error}'
+
+    record['total_seconds'] = time.perf_counter() - started
+    return record
+
+
+class ResultWriter:
+    """
+    Writes result records as they come in, as JSON lines or (for a '.csv'
+    filename) as CSV rows.
+
+    """
+
+    def __init__(self, filename):
+        self._file = open(filename, 'w', newline='')
+        self._csv = None
+        if filename.lower().endswith('.csv'):
+            self._csv = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS)
+            self._csv.writeheader()
+
+    def write(self, record):
+        if self._csv is not None:
+            self._csv.writerow(record)
+        else:
+            self._file.write(json.dumps(record) + '\n')
+        # Flushed for every record, so that the progress of a long batch can be followed
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def run_batch(jobs, results_filename, workers=None):
+    """
+    Run all the jobs on a pool of 'workers' processes (by default one per
+    core) and write a record for every job to 'results_filename' as soon as
+    it is done. Returns the records, in the order of the jobs.
+
+    """
+    jobs = [dict(job, job=number) for number, job in enumerate(jobs)]
+    records = [None] * len(jobs)
+
+    writer = ResultWriter(results_filename)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Small chunks keep the workers busy without sending every thumbnail on its own
+            chunksize = max(1, min(16, len(jobs) // (4 * (workers or os.cpu_count() or 1))))
+            for record in pool.map(run_job, jobs, chunksize=chunksize):
+                records[record['job']] = record
+                writer.write(record)
+                print(f'[{record["job"] + 1}/{len(jobs)}] {record["input"]}: {record["status"]}'
+                      f'{" (" + record["error"] + ")" if record["error"] else ""}'
+                      f' in {record["total_seconds"]:.3f}s')
+    finally:
+        writer.close()
+
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Carve many images on a pool of worker processes.')
+    parser.add_argument('source', help='a directory of images, or a JSON or CSV manifest of jobs')
+    parser.add_argument('--output-dir', help='where outputs go (required for a directory, and for jobs without an output)')
+    parser.add_argument('--results', default='batch-results.jsonl',
+                        help="the result and timing records: JSON lines, or CSV for a '.csv' name "
+                             "(default batch-results.jsonl)")
+    parser.add_argument('--workers', type=int, default=None, metavar='N',
+                        help='the number of worker processes (default: one per core)')
+
+    directory = parser.add_argument_group('directory jobs')
+    directory.add_argument('--operation', choices=('width', 'height'), default='width',
+                           help='remove vertical seams (width, default) or horizontal seams (height)')
+    size = directory.add_mutually_exclusive_group()
+    size.add_argument('--seams', type=int, help='the number of seams to remove from every image')
+    size.add_argument('--target', type=int, help='the width (or height) to carve every image down to')
+    directory.add_argument('--seams-per-pass', type=int, default=1, metavar='K',
+                           help='remove up to K seams per energy computation (faster, approximate; default 1)')
+    add_energy_argument(directory)
+    args = parser.parse_args()
+
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.seams_per_pass < 1:
+        parser.error('--seams-per-pass must be at least 1')
+
+    if os.path.isdir(args.source):
+        if args.output_dir is None:
+            parser.error('--output-dir is required when the source is a directory')
+        if args.seams is None and args.target is None:
+            parser.error('either --seams or --target is required when the source is a directory')
+        fields = {'seams': args.seams, 'seams_per_pass': args.seams_per_pass, 'energy': args.energy}
+        if args.target is not None:
+            fields[args.operation] = args.target
+        jobs = jobs_from_directory(args.source, args.output_dir, args.operation, **fields)
+    else:
+        try:
+            jobs = jobs_from_manifest(args.source, args.output_dir)
+        except (OSError, ValueError, KeyError) as error:
+            parser.error(f'Could not read the manifest {args.source}: {error}')
+
+    print(f'Running {len(jobs)} jobs...')
+    started = time.perf_counter()
+    records = run_batch(jobs, args.results, args.workers)
+
+    failed = sum(record['status'] != 'ok' for record in records)
+    print(f'Completed {len(records) - failed} jobs ({failed} failed) in {time.perf_counter() - started:.2f}s')
+    print(f'Results saved to {args.results}')
@@ -0,0 +1,289 @@
+"""
+
+Benchmarks of every stage of the carving pipeline. Deterministic synthetic images
+(from 256x256 up to 4K) and the bundled scenic image are run through reading,
+energy, both seam searches, seam removal, writing and whole 'remove_n_seams'
+runs. Every stage is timed over a few repeats, and its peak memory is measured in
+a separate run (with 'tracemalloc', which NumPy reports its buffers to), so the
+tracing does not slow down the timed runs.
+
+The results are written as JSON. With '--compare', they are checked against the
+results of an earlier run, and every stage that got slower (or used more memory)
+by more than the threshold is flagged as a regression.
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import reduce_width_image
+from energy_image import DEFAULT_ENERGY, add_energy_argument, compute_energy
+from seam_identification_horizontal import compute_horizontal_seam
+from seam_identification_vertical import compute_vertical_seam
+from snapshots import SeamSnapshots
+from utils import read_image, read_image_into_array, write_array_into_image, write_image
+
+
+# The synthetic image sizes, as (width, height)
+SYNTHETIC_SIZES = ((256, 256), (512, 512), (1024, 1024), (1920, 1080), (3840, 2160))
+
+SCENIC_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'input_images', 'scenic_image.jpg')
+
+STAGES = (
+    'read_image_into_array', 'compute_energy', 'compute_vertical_seam', 'compute_horizontal_seam',
+    'remove_seam_from_image', 'write_array_into_image', 'remove_n_seams',
+)
+
+# The default share by which a stage may get slower (or use more memory) before it counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+# The settings of a run that change what a stage measures, so reports are only compared when they agree
+# (reports from before the energy could be chosen used the default one)
+COMPARED_SETTINGS = {'num_seams': None, 'energy': DEFAULT_ENERGY}
+
+# Time differences below this are timer noise on the smallest images, and never count as regressions
+MIN_REGRESSION_SECONDS = 0.002
+
+
+def synthetic_image(width, height, seed=0):
+    """
+    A deterministic test image: smooth colour gradients, a few solid shapes
+    (so there are both flat regions and sharp edges) and some noise.
+
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.linspace(0, 1, height)[:, np.newaxis]
+    cols = np.linspace(0, 1, width)[np.newaxis, :]
+
+    pixels = np.empty((height, width, 3), dtype=np.float64)
+    pixels[..., 0] = 255 * rows
+    pixels[..., 1] = 255 * cols
+    pixels[..., 2] = 127 + 127 * np.sin(6 * np.pi * rows) * np.cos(4 * np.pi * cols)
+
+    for _ in range(12):
+        top, left = rng.integers(0, height), rng.integers(0, width)
+        bottom = min(height, top + rng.integers(height // 16 + 1, height // 4 + 2))
+        right = min(width, left + rng.integers(width // 16 + 1, width // 4 + 2))
+        pixels[top:bottom, left:right] = rng.integers(0, 256, 3)
+
+    pixels += rng.normal(0, 6, pixels.shape)
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+def benchmark_images(sizes=SYNTHETIC_SIZES, scenic=True):
+    """
+    Yield (name, pixels) for every image to benchmark.
+
+    """
+    for width, height in sizes:
+        yield f'synthetic-{width}x{height}', synthetic_image(width, height)
+    if scenic:
+        yield 'scenic_image', read_image(SCENIC_IMAGE)
+
+
+def stage_runners(pixels, scratch, num_seams, energy_function=DEFAULT_ENERGY):
+    """
+    The benchmarked call of every stage for the given image, with everything
+    a stage needs (but does not measure) prepared up front, using the given
+    energy function.
+
+    """
+    image_filename = os.path.join(scratch, 'input.png')
+    write_image(pixels, image_filename)
+    output_filename = os.path.join(scratch, 'output.png')
+
+    energy_data = compute_energy(pixels, energy_function=energy_function)
+    seam, _ = compute_vertical_seam(energy_data)
+
+    def remove_n_seams():
+        # The progress line of every seam would only measure the terminal
+        reduce_width_image.remove_n_seams(pixels, num_seams, SeamSnapshots('off'), verbose=False,
+                                          energy_function=energy_function)
+
+    return {
+        'read_image_into_array': lambda: read_image_into_array(image_filename),
+        'compute_energy': lambda: compute_energy(pixels, energy_function=energy_function),
+        'compute_vertical_seam': lambda: compute_vertical_seam(energy_data),
+        'compute_horizontal_seam': lambda: compute_horizontal_seam(energy_data),
+        'remove_seam_from_image': lambda: reduce_width_image.remove_seam_from_image(pixels, seam),
+        'write_array_into_image': lambda: write_array_into_image(pixels, output_filename),
+        'remove_n_seams': remove_n_seams,
+    }
+
+
+def measure(run, repeat):
+    """
+    Time 'run' 'repeat' times, and measure its peak memory in one more run.
+    Returns a result dictionary.
+
+    """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'seconds_min': min(times),
+        'seconds_median': statistics.median(times),
+        'repeat': repeat,
+        'peak_bytes': peak,
+    }
+
+
+def run_benchmarks(sizes=SYNTHETIC_SIZES, scenic=True, stages=STAGES, repeat=3, num_seams=10, verbose=True,
+                   energy_function=DEFAULT_ENERGY):
+    """
+    Run the benchmarks and return the report (see the module documentation).
+
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix='seam-benchmark-') as scratch:
+        for name, pixels in benchmark_images(sizes, scenic):
+            runners = stage_runners(pixels, scratch, num_seams, energy_function)
+            for stage in stages:
+                result = {'image': name, 'shape': list(pixels.shape[:2]), 'stage': stage}
+                result.update(measure(runners[stage], repeat))
+                results.append(result)
+                if verbose:
+                    print(f'{name:24} {stage:24} {result["seconds_min"]:9.4f}s '
+                          f'{result["peak_bytes"] / 2 ** 20:9.1f} MB')
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpus': os.cpu_count(),
+            'num_seams': num_seams,
+            'energy': energy_function,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def settings_differences(meta, baseline_meta):
+    """
+    The settings of COMPARED_SETTINGS that differ between the 'meta' of two
+    reports, as a list of 'name: baseline -> report' descriptions.
+
+    """
+    differences = []
+    for name, default in COMPARED_SETTINGS.items():
+        before, after = baseline_meta.get(name, default), meta.get(name, default)
+        if before != after:
+            differences.append(f'{name}: {before} -> {after}')
+
+    return differences
+
+
+def compare_reports(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare a report with a baseline report, stage by stage. Returns a list of
+    comparisons for the stages that both have, each flagged as a regression
+    when its fastest time or its peak memory grew by more than 'threshold'
+    (and, for the time, by more than MIN_REGRESSION_SECONDS).
+
+    Raises ValueError when the reports were run with different settings (see
+    COMPARED_SETTINGS), whose timings cannot be compared.
+
+    """
+    differences = settings_differences(report['meta'], baseline['meta'])
+    if differences:
+        raise ValueError(f'The reports were run with different settings ({", ".join(differences)})')
+
+    previous = {(result['image'], result['stage']): result for result in baseline['results']}
+
+    comparisons = []
+    for result in report['results']:
+        before = previous.get((result['image'], result['stage']))
+        if before is None:
+            continue
+
+        time_ratio = result['seconds_min'] / before['seconds_min'] if before['seconds_min'] else 1.0
+        memory_ratio = result['peak_bytes'] / before['peak_bytes'] if before['peak_bytes'] else 1.0
+        slower = time_ratio > 1 + threshold and result['seconds_min'] - before['seconds_min'] > MIN_REGRESSION_SECONDS
+        comparisons.append({
+            'image': result['image'],
+            'stage': result['stage'],
+            'time_ratio': time_ratio,
+            'memory_ratio': memory_ratio,
+            'regression': slower or memory_ratio > 1 + threshold,
+        })
+
+    return comparisons
+
+
+def parse_size(text):
+    width, _, height = text.lower().partition('x')
+    try:
+        return int(width), int(height or width)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Expected a size like 512x512 (or just 512), got {text!r}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark every stage of the carving pipeline.')
+    parser.add_argument('--output', default='benchmark.json', help='where the JSON report goes (default benchmark.json)')
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=list(SYNTHETIC_SIZES), metavar='WxH',
+                        help='the synthetic image sizes (default: 256x256 512x512 1024x1024 1920x1080 3840x2160)')
+    parser.add_argument('--no-scenic', action='store_true', help='leave out the bundled scenic image')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help='the stages to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage (default 3)')
+    parser.add_argument('--seams', type=int, default=10, help='the seams removed by the remove_n_seams stage (default 10)')
+    add_energy_argument(parser, help=f'the energy function of the energy and carving stages (default {DEFAULT_ENERGY})')
+    parser.add_argument('--compare', metavar='BASELINE', help='a report of an earlier run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'how much slower (or larger) counts as a regression (default {DEFAULT_THRESHOLD:g})')
+    args = parser.parse_args()
+
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        # Checked before the run, rather than finding out after all the benchmarks
+        differences = settings_differences({'num_seams': args.seams, 'energy': args.energy}, baseline['meta'])
+        if differences:
+            parser.error(f'the baseline {args.compare} was run with different settings ({", ".join(differences)})')
+
+    report = run_benchmarks(args.sizes, not args.no_scenic, args.stages, args.repeat, args.seams,
+                            energy_function=args.energy)
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f'Results saved to {args.output}')
+
+    if baseline is not None:
+        comparisons = compare_reports(report, baseline, args.threshold)
+        regressions = [comparison for comparison in comparisons if comparison['regression']]
+
+        for comparison in comparisons:
+            flag = 'REGRESSION' if comparison['regression'] else ''
+            print(f'{comparison["image"]:24} {comparison["stage"]:24} time {comparison["time_ratio"]:6.2f}x '
+                  f'memory {comparison["memory_ratio"]:6.2f}x {flag}')
+        print(f'{len(regressions)} regressions out of {len(comparisons)} compared stages '
+              f'(threshold {args.threshold:.0%})')
+
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,274 @@
+"""
+
+A content-addressed cache on disk for the results of carving. Entries are keyed
+by a hash of the image's pixels plus the parameters of the operation, so the
+same asset carved again (under any file name) is found again, and any change to
+the pixels or the parameters is a different entry. Three kinds of entries are
+kept, as compressed NumPy archives:
+
+  - 'energy': the energy map of an image,
+  - 'seams': the seams removed from an image, in order, which also serve any
+    smaller number of seams with the same parameters,
+  - 'output': the carved image for a given number of seams.
+
+Writes go to a temporary file that is renamed into place, so several processes
+can share a cache directory and readers never see a partial entry. The cache
+is kept under a size limit by evicting the least recently used entries (every
+hit refreshes the modification time of its file).
+
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+
+from carving import carve_seams
+from energy_image import DEFAULT_ENERGY, compute_energy, get_energy_function
+from seam_engine import CarvingBuffer
+from utils import as_pixel_array
+
+
+# The default size limit of a cache directory
+DEFAULT_CACHE_BYTES = 1 << 30
+
+CACHE_KINDS = ('energy', 'seams', 'output')
+
+# Temporary files older than this were left behind by a writer that died, and are removed on eviction
+STALE_TEMP_SECONDS = 3600
+
+
+def image_key(pixels):
+    """
+    The content hash of an image: its shape and every pixel value.
+
+    """
+    pixels = np.ascontiguousarray(as_pixel_array(pixels))
+
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(repr(pixels.shape).encode('ascii'))
+    digest.update(pixels.data)
+    return digest.hexdigest()
+
+
+def array_key(array):
+    """
+    The content hash of any array (for example a mask): its type, shape and values.
+
+    """
+    array = np.ascontiguousarray(array)
+
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f'{array.dtype.str}{array.shape}'.encode('ascii'))
+    digest.update(array.data)
+    return digest.hexdigest()
+
+
+def cache_key(content_key, **params):
+    """
+    The key of an entry: the content hash of the image plus the parameters of
+    the operation (anything JSON can encode).
+
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(content_key.encode('ascii'))
+    digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class CarvingCache:
+    """
+    A cache directory shared by any number of processes, holding at most
+    'max_bytes' of entries.
+
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, kind, key):
+        if kind not in CACHE_KINDS:
+            raise ValueError(f'Unknown cache entry kind {kind!r}, expected one of {CACHE_KINDS}')
+        return os.path.join(self.directory, kind, key[:2], f'{key}.npz')
+
+    def get(self, kind, key):
+        """
+        Return the arrays of an entry as a dictionary, or None when it is not
+        in the cache.
+
+        """
+        path = self._path(kind, key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError, zipfile.BadZipFile):
+            # Missing, or evicted by another process while it was being read
+            return None
+
+        try:
+            # Marking the entry as recently used for the eviction
+            os.utime(path)
+        except OSError:
+            pass
+
+        return arrays
+
+    def put(self, kind, key, **arrays):
+        """
+        Store the given arrays as an entry, replacing any entry with the same
+        key, and evict old entries if the cache grew over its limit.
+
+        """
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                np.savez_compressed(file, **arrays)
+            # Renaming is atomic, so other processes see either the old entry or the new one
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+        self.evict()
+
+    def _entries(self):
+        for kind in CACHE_KINDS:
+            for root, _, files in os.walk(os.path.join(self.directory, kind)):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_mtime, stat.st_size
+
+    def size(self):
+        """
+        The number of bytes the entries of the cache take up.
+
+        """
+        return sum(size for path, _, size in self._entries() if path.endswith('.npz'))
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is within its
+        size limit.
+
+        """
+        now = time.time()
+        entries = []
+        for path, mtime, size in self._entries():
+            if path.endswith('.npz'):
+                entries.append((mtime, size, path))
+            elif now - mtime > STALE_TEMP_SECONDS:
+                self._remove(path)
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            # Another process removed it first
+            pass
+
+    def energy(self, pixels, content_key=None, energy_function=DEFAULT_ENERGY):
+        """
+        The energy of the image (like 'energy_image.compute_energy'), from the
+        cache when it was computed before with the same energy function.
+
+        """
+        energy_function = get_energy_function(energy_function)
+        key = cache_key(content_key or image_key(pixels), kind='energy', energy=energy_function.name)
+
+        entry = self.get('energy', key)
+        if entry is not None:
+            return entry['energy']
+
+        energy = compute_energy(pixels, energy_function=energy_function)
+        self.put('energy', key, energy=energy)
+        return energy
+
+    def carve(self, pixels, num_seams_to_remove, vertical=True, snapshots=None, mark_params=None, **options):
+        """
+        'carving.carve_seams' through the cache. Returns (pixels, removed_energy)
+        like it does, but straight from the cache when the same image was carved
+        with the same parameters before, and by replaying the cached seams when
+        at least as many seams were removed before. Only a run that actually
+        carves saves snapshots.
+
+        'options' are the other arguments of 'carve_seams'. A run with
+        'mark_energy' or a 'mask' is only cached when 'mark_params' describes
+        the marking (for example the box of an object); otherwise it just carves.
+        The 'keep' and 'priority' masks are keyed by their contents.
+
+        """
+        marked = options.get('mark_energy') is not None or options.get('mask') is not None
+        if marked and mark_params is None:
+            return carve_seams(pixels, num_seams_to_remove, vertical, snapshots, **options)
+
+        pixels = as_pixel_array(pixels)
+        content_key = image_key(pixels)
+
+        pyramid_levels = options.get('pyramid_levels', 0)
+        energy_function = get_energy_function(options.get('energy_function', DEFAULT_ENERGY))
+        params = {
+            'vertical': vertical,
+            'seams_per_pass': options.get('seams_per_pass', 1),
+            'pyramid_levels': pyramid_levels,
+            'pyramid_band': options.get('pyramid_band') if pyramid_levels > 0 else None,
+            'mark': mark_params,
+            'criterion': options.get('criterion', 'backward'),
+            'energy': energy_function.name,
+            'keep': array_key(np.asarray(options['keep'], dtype=bool)) if options.get('keep') is not None else None,
+            'priority': array_key(options['priority']) if options.get('priority') is not None else None,
+        }
+
+        output_key = cache_key(content_key, kind='output', seams=num_seams_to_remove, **params)
+        entry = self.get('output', output_key)
+        if entry is not None:
+            return entry['pixels'], int(entry['removed_energy'])
+
+        # The seams of a longer run are the first seams of any shorter one when they are
+        # removed one at a time (several at a time, the last pass depends on the total)
+        seams_key = cache_key(content_key, kind='seams', **params) if params['seams_per_pass'] == 1 else None
+        cached_seams = self.get('seams', seams_key) if seams_key is not None else None
+
+        if cached_seams is not None and len(cached_seams['seams']) >= num_seams_to_remove:
+            carving_buffer = CarvingBuffer(pixels, vertical=vertical)
+            for seam in cached_seams['seams'][:num_seams_to_remove]:
+                carving_buffer.remove_seam(seam)
+            carved = carving_buffer.pixels
+            removed_energy = int(cached_seams['energies'][:num_seams_to_remove].sum())
+        else:
+            seam_log = []
+            carved, removed_energy = carve_seams(
+                pixels, num_seams_to_remove, vertical, snapshots,
+                energy=self.energy(pixels, content_key, energy_function), seam_log=seam_log, **options
+            )
+            if seams_key is not None and num_seams_to_remove > 0:
+                seams = np.array([seam for seam, _ in seam_log])
+                energies = np.array([energy for _, seam_energies in seam_log for energy in seam_energies])
+                # Columns fit into 16 bits for all but the widest images
+                dtype = np.uint16 if seams.max() <= np.iinfo(np.uint16).max else np.uint32
+                self.put('seams', seams_key, seams=seams.astype(dtype), energies=energies)
+
+        self.put('output', output_key, pixels=carved, removed_energy=removed_energy)
+        return carved, removed_energy
@@ -0,0 +1,536 @@
+"""
+The seam carving loop shared by 'reduce_width_image', 'reduce_height_image' and
+'remove_object'. Each iteration finds the lowest-energy seam, saves a snapshot
+of it if asked to, and removes it from the image, while the image, its energy
+and the state of the seam search are all reused from one seam to the next.
+'enlarge_image' goes the other way and stretches seams to enlarge an image.
+
+"""
+
+
+import time
+
+import numpy as np
+
+from energy_image import DEFAULT_ENERGY, ENERGY_DTYPE, EnergyMap, compute_energy, get_energy_function
+from instrumentation import CarvingEvent, ObserverGroup, ProgressPrinter
+from overlays import energy_overlay, overlay_unit
+from seam_engine import (
+    DEFAULT_PYRAMID_BAND, MAX_FORWARD_COST, SEAM_CRITERIA, CarvingBuffer, SeamTable, SeamWorkspace, fill_forward_table, fill_seam_table,
+    find_seam_pyramid, find_seams, insert_seams, pixel_intensity, seam_from_table, visualize_seams
+)
+from snapshots import SeamSnapshots
+from utils import as_pixel_array, shift_out_seam, shift_out_seams
+
+
+def check_approximation(seams_per_pass, pyramid_levels):
+    """
+    Raise ValueError unless 'seams_per_pass' is at least 1 and 'pyramid_levels'
+    at least 0, as 'carve_seams' needs them.
+
+    """
+    if seams_per_pass < 1:
+        raise ValueError(f'At least one seam has to be removed per pass, got seams_per_pass={seams_per_pass}')
+    if pyramid_levels < 0:
+        raise ValueError(f'The number of pyramid levels cannot be negative, got pyramid_levels={pyramid_levels}')
+
+
+def carve_seams(pixels, num_seams_to_remove, vertical=True, snapshots=None,
+                seams_per_pass=1, mark_energy=None, pyramid_levels=0, pyramid_band=DEFAULT_PYRAMID_BAND,
+                workers=1, verbose=True, energy=None, seam_log=None, observer=None, mask=None,
+                criterion='backward', energy_function=DEFAULT_ENERGY, keep=None, priority=None):
+    """
+    Remove 'num_seams_to_remove' vertical seams (or horizontal seams, with
+    'vertical=False') from the image, one lowest-energy seam at a time.
+
+    'snapshots' (a 'snapshots.SeamSnapshots') decides which intermediate seam
+    images are saved; by default one is saved for every seam.
+
+    With 'seams_per_pass' larger than 1, up to that many non-crossing seams are
+    taken from every energy computation and removed together (see
+    'seam_engine.find_seams'). This is faster, but only approximates the result
+    of removing the seams one at a time; 'carving_drift' measures how much.
+
+    With 'pyramid_levels' larger than 0, every single seam is searched for
+    coarse-to-fine instead (see 'seam_engine.find_seam_pyramid'), refining it
+    within 'pyramid_band' columns at every level. This is also faster and also
+    approximate; it does not apply to the seams found several at a time.
+
+    'workers' splits the full energy computations between that many processes
+    and the seam searches of wide images between that many threads (see
+    'energy_image.compute_energy' and 'seam_engine.fill_rows').
+
+    Every stage of every pass is reported to 'observer', when given, as an
+    'instrumentation.CarvingEvent' (see 'instrumentation' for the observers
+    that log the events or sum up their timings). A line for every seam is
+    printed unless 'verbose' is False.
+
+    'energy_function' selects the energy of the pixels from the registry of
+    'energy_image' (by name or as an 'energy_image.EnergyFunction').
+
+    'energy', when given, is the already computed energy of the image (see
+    'energy_image.EnergyMap'), for the same 'energy_function'. 'seam_log', when given, is a list to which a
+    tuple (seams, energies) is appended for every pass, in the order the seams
+    are removed: an (H,) array for a single seam, or an (H, k) array for k
+    seams removed together, with the columns they had in the image at that
+    point, and the list of their energies.
+
+    'mark_energy', when given, is called as mark_energy(energy, seam_number)
+    with a scratch copy of the current energy before every seam search, and
+    returns the energy to search in (for example with an object marked in it).
+
+    'mask', when given instead, is an (H, W) boolean array of pixels to remove
+    (an object). It shrinks along with the image, every seam is steered
+    through as many of its pixels as it can take, and the carving stops as
+    soon as all of them are removed, even before 'num_seams_to_remove' seams.
+    The seam energies reported for it leave the mask out.
+
+    With criterion='forward', every seam is the one whose removal creates the
+    smallest new edges instead of the one with the lowest energy (see
+    'seam_engine.fill_forward_table'). The intensities it is computed from are
+    kept in a buffer that shrinks along with the image. It only applies to
+    the exact seams removed one at a time, and works with a 'mask' but not
+    with 'mark_energy'. The seam energies reported for it are still the
+    energies of the removed pixels, so that they compare with the default.
+
+    'keep', when given, is an (H, W) boolean array of pixels to keep (faces,
+    logos), which the seams go around whenever they can, and 'priority' an
+    (H, W) array of weights from -1 (remove first) to 1 (keep). Both are
+    turned into one overlay once (see 'overlays.energy_overlay'), which is
+    added to the energy before every seam search and shrinks along with the
+    image. A seam only crosses kept pixels to take more of a 'mask' than it
+    crosses of them. The seam energies reported leave the overlay out.
+
+    Returns a tuple (pixels, removed_energy) with the carved image, as a view
+    into the carving buffer, and the sum of the energies of the removed seams.
+
+    """
+    if snapshots is None:
+        snapshots = SeamSnapshots()
+    if mask is not None and mark_energy is not None:
+        raise ValueError('Either a mask or a mark_energy function can be given, not both')
+    if criterion not in SEAM_CRITERIA:
+        raise ValueError(f'Unknown seam criterion {criterion!r}, expected one of {SEAM_CRITERIA}')
+    check_approximation(seams_per_pass, pyramid_levels)
+    forward = criterion == 'forward'
+    energy_function = get_energy_function(energy_function)
+    if forward and (seams_per_pass > 1 or pyramid_levels > 0 or mark_energy is not None):
+        raise ValueError('The forward criterion only applies to exact seams removed one at a time, '
+                         'without a mark_energy function')
+    observer = ObserverGroup(ProgressPrinter() if verbose else None, observer)
+    clock = time.perf_counter
+
+    def emit(stage, started, seam=None, count=1, energy=None, filename=None):
+        observer(CarvingEvent(stage, seam, count, num_seams_to_remove, image_rows, image_cols, vertical,
+                              clock() - started, energy, filename))
+
+    # The image is copied into a carving buffer once, and every seam is removed from it in place
+    carving_buffer = CarvingBuffer(pixels, vertical=vertical)
+    pixels = carving_buffer.pixels
+    image_rows, image_cols = pixels.shape[:2]
+
+    # The energy is computed once and then only updated around every removed seam
+    started = clock()
+    energy_map = EnergyMap(pixels, vertical=vertical, workers=workers, energy=energy, energy_function=energy_function)
+    emit('energy', started)
+    # The buffers of the seam search are allocated once and reused for every seam
+    workspace = SeamWorkspace()
+
+    # The highest cost of a single pixel in the seam search
+    max_pixel_cost = MAX_FORWARD_COST if forward else energy_function.max_energy
+    seam_shape = carving_buffer.seam_pixels.shape[:2]
+
+    # The keep-regions and priorities as one overlay, laid out like the carving buffer and
+    # shrinking along with the image
+    overlay_buffer = energy_overlay((image_rows, image_cols), max_pixel_cost, keep, priority, vertical)
+
+    # The mask is laid out like the carving buffer and shrinks along with the image. Its
+    # pixels are given an energy so low that taking one more of them outweighs anything a
+    # seam can collect elsewhere, so every seam runs through as much of the mask as it can
+    mask_buffer = None
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (image_rows, image_cols):
+            raise ValueError(f'The mask is {mask.shape}, but the image is {(image_rows, image_cols)}')
+        mask_buffer = np.array(mask if vertical else mask.T)
+        mask_left = int(np.count_nonzero(mask_buffer))
+        mask_value = -(overlay_unit(max_pixel_cost, priority) * seam_shape[0] + 1)
+
+    marked = mask_buffer is not None or overlay_buffer is not None
+    masked_energy = np.empty(seam_shape, dtype=ENERGY_DTYPE) if marked else None
+
+    def search_layout(energy_data):
+        # Seams are searched for in the layout where they run along the rows
+        search_energy = energy_data if vertical else energy_data.T
+        if not marked:
+            return search_energy
+
+        rows, cols = search_energy.shape
+        scratch = masked_energy[:rows, :cols]
+        if forward:
+            # The forward costs do not come from the energy, so only the masks are laid over them
+            scratch.fill(0)
+        else:
+            np.copyto(scratch, search_energy)
+        if overlay_buffer is not None:
+            scratch += overlay_buffer[:, :cols]
+        if mask_buffer is not None:
+            np.copyto(scratch, mask_value, where=mask_buffer[:, :cols])
+        return scratch
+
+    # The intensities the forward costs are computed from, laid out like the carving buffer
+    # and shrinking along with the image
+    intensity_buffer = pixel_intensity(carving_buffer.seam_pixels) if forward else None
+
+    # When the exact seams are removed one at a time, the memoization table of the seam
+    # search is also carried from one seam to the next and only updated where the removed
+    # seam changed it (at the start of the next pass, so the last seam does not update it)
+    seam_table = None
+    if seams_per_pass == 1 and pyramid_levels == 0 and mark_energy is None and not forward:
+        started = clock()
+        seam_table = SeamTable(search_layout(energy_map.energy), workers, energy_function)
+        emit('dp', started)
+    # Scratch space for 'mark_energy', so that the marking does not leak into the energy map
+    marked_energy = np.empty_like(energy_map.energy) if mark_energy is not None else None
+
+    def visualize(pixels, seams):
+        return visualize_seams(pixels, seams, vertical)
+
+    removed = 0
+    removed_energy = 0
+    # The seam removed in the previous pass, which the seam table has not been updated for yet
+    pending_seam = None
+
+    snapshots.start(pixels, vertical=vertical)
+    try:
+        while removed < num_seams_to_remove and (mask_buffer is None or mask_left > 0):
+            count = min(seams_per_pass, num_seams_to_remove - removed)
+            batch = count > 1
+            image_rows, image_cols = pixels.shape[:2]
+            pass_started = clock()
+
+            energy_data = energy_map.energy
+
+            if mark_energy is not None:
+                started = clock()
+                scratch = marked_energy[:image_rows, :image_cols]
+                np.copyto(scratch, energy_data)
+                energy_data = mark_energy(scratch, removed)
+                emit('mark', started, removed, count)
+
+            if marked:
+                started = clock()
+                search_energy = search_layout(energy_data)
+                emit('mark', started, removed, count)
+            else:
+                search_energy = search_layout(energy_data)
+
+            if pending_seam is not None:
+                started = clock()
+                seam_table.remove_seam(search_energy, pending_seam)
+                emit('update', started, removed, count)
+
+            started = clock()
+            if not batch:
+                if seam_table is not None:
+                    seams, seam_energy = seam_table.find_seam()
+                    emit('backtrack', started, removed, count, seam_energy)
+                elif pyramid_levels > 0:
+                    seams, seam_energy = find_seam_pyramid(
+                        search_energy, pyramid_levels, pyramid_band, workspace, workers
+                    )
+                    emit('dp', started, removed, count, seam_energy)
+                else:
+                    if forward:
+                        cost, back_pointers = fill_forward_table(
+                            intensity_buffer[:, :carving_buffer.width], workspace,
+                            search_energy if marked else None
+                        )
+                    else:
+                        cost, back_pointers = fill_seam_table(search_energy, workspace, workers)
+                    emit('dp', started, removed, count)
+                    started = clock()
+                    seams, seam_energy = seam_from_table(cost, back_pointers)
+                    emit('backtrack', started, removed, count, seam_energy)
+                seam_energies = [seam_energy]
+            else:
+                seams, seam_energies = find_seams(search_energy, count, workspace, workers)
+                count = seams.shape[1]
+                emit('dp', started, removed, count, int(np.sum(seam_energies)))
+
+            if marked or forward:
+                # The energies of the pixels of the seams (without the masks, and not the forward
+                # costs), and the masked pixels they remove
+                plain_energy = energy_data if vertical else energy_data.T
+                seam_rows = np.arange(len(plain_energy))
+                seam_columns = seams.reshape(len(seam_rows), -1)
+                seam_energies = plain_energy[seam_rows[:, np.newaxis], seam_columns].sum(axis=0).tolist()
+                if mask_buffer is not None:
+                    mask_left -= int(np.count_nonzero(mask_buffer[seam_rows[:, np.newaxis], seam_columns]))
+            pass_energy = int(np.sum(seam_energies))
+            removed_energy += pass_energy
+
+            started = clock()
+            # A run with a mask ends as soon as the mask is empty, so the last snapshot is the
+            # one of this pass then, however many seams were allowed
+            num_seams = removed + count if mask_buffer is not None and mask_left <= 0 else num_seams_to_remove
+            snapshot_filename = snapshots.add(removed, num_seams, pixels, seams, visualize)
+            if snapshot_filename is not None:
+                emit('snapshot', started, removed, count, filename=snapshot_filename)
+
+            started = clock()
+            if not batch:
+                for buffer in (mask_buffer, overlay_buffer, intensity_buffer):
+                    if buffer is not None:
+                        shift_out_seam(buffer[:, :carving_buffer.width], seams)
+                carving_buffer.remove_seam(seams)
+                pixels = carving_buffer.pixels
+                emit('removal', started, removed, count)
+
+                started = clock()
+                if vertical:
+                    energy_map.remove_vertical_seam(pixels, seams)
+                else:
+                    energy_map.remove_horizontal_seam(pixels, seams)
+                emit('energy', started, removed, count)
+
+                if seam_table is not None:
+                    pending_seam = seams
+            else:
+                for buffer in (mask_buffer, overlay_buffer):
+                    if buffer is not None:
+                        shift_out_seams(buffer[:, :carving_buffer.width], seams)
+                carving_buffer.remove_seams(seams)
+                pixels = carving_buffer.pixels
+                emit('removal', started, removed, count)
+
+                # Several seams were removed at once, so the energy is computed again from scratch
+                started = clock()
+                energy_map.refresh(pixels)
+                emit('energy', started, removed, count)
+
+            if seam_log is not None:
+                seam_log.append((seams, list(seam_energies)))
+            emit('seam', pass_started, removed, count, pass_energy)
+            removed += count
+    finally:
+        # Waiting for the snapshots that are still being written in the background
+        snapshots.close()
+
+    # It is a view into the carving buffer, so no extra copy of the image is made here
+    return pixels, removed_energy
+
+
+def retarget(pixels, width, height, workers=1, verbose=True, seam_log=None, observer=None,
+             energy_function=DEFAULT_ENERGY):
+    """
+    Carve the image to exactly 'width' x 'height' in one run, interleaving
+    vertical and horizontal seams. At every step the lowest-energy vertical
+    and horizontal seams are compared, and the cheaper one is removed (the
+    vertical one on ties), until both sizes are reached. A size larger than
+    the image is reached afterwards by stretching seams (see 'enlarge_image').
+
+    Both directions share one carving buffer and one energy map, updated
+    around every removed seam. Each direction also keeps its seam table: the
+    table of the direction that was carved is updated in place, while the
+    other one no longer fits the image and is filled again the next time it is
+    needed, so a run of seams in the same direction costs one table update
+    per seam.
+
+    'workers', 'verbose', 'observer' and 'energy_function' are the same as
+    for 'carve_seams'. 'seam_log', when given, is a list to which a tuple
+    (vertical, seam, energy) is appended for every removed seam. Returns a
+    tuple (pixels, removed_energy).
+
+    """
+    pixels = as_pixel_array(pixels)
+    rows, cols = pixels.shape[:2]
+    if width < 1 or height < 1:
+        raise ValueError(f'The target size has to be at least 1x1, got {width}x{height}')
+
+    # The seams still to remove in every direction (vertical seams make the image narrower)
+    remaining = {True: max(cols - width, 0), False: max(rows - height, 0)}
+    total = sum(remaining.values())
+    observer = ObserverGroup(ProgressPrinter() if verbose else None, observer)
+    clock = time.perf_counter
+
+    def emit(stage, started, vertical, energy=None, setup=False):
+        observer(CarvingEvent(stage, None if setup else removed, 1, total, image_rows, image_cols, vertical,
+                              clock() - started, energy, None))
+
+    carving_buffer = CarvingBuffer(pixels)
+    pixels = carving_buffer.pixels
+    image_rows, image_cols = pixels.shape[:2]
+    removed = 0
+    removed_energy = 0
+
+    started = clock()
+    energy_map = EnergyMap(pixels, workers=workers, energy_function=energy_function)
+    emit('energy', started, True, setup=True)
+
+    # The seam table of each direction, or None when it has to be filled again
+    seam_tables = {True: None, False: None}
+
+    while remaining[True] or remaining[False]:
+        image_rows, image_cols = pixels.shape[:2]
+        pass_started = clock()
+
+        candidates = {}
+        for vertical in (True, False):
+            if not remaining[vertical]:
+                continue
+            if seam_tables[vertical] is None:
+                started = clock()
+                energy_data = energy_map.energy
+                # Horizontal seams are searched for in a contiguous copy of the transposed energy
+                seam_tables[vertical] = SeamTable(energy_data if vertical else np.ascontiguousarray(energy_data.T),
+                                                  workers, energy_map.energy_function)
+                emit('dp', started, vertical)
+            started = clock()
+            candidates[vertical] = seam_tables[vertical].find_seam()
+            emit('backtrack', started, vertical, candidates[vertical][1])
+
+        # The cheaper seam goes first, the vertical one on ties
+        vertical = min(candidates, key=lambda direction: (candidates[direction][1], not direction))
+        seam, seam_energy = candidates[vertical]
+
+        started = clock()
+        if vertical:
+            carving_buffer.remove_seam(seam)
+        else:
+            carving_buffer.remove_cross_seam(seam)
+        pixels = carving_buffer.pixels
+        emit('removal', started, vertical)
+
+        started = clock()
+        if vertical:
+            energy_map.remove_vertical_seam(pixels, seam)
+        else:
+            energy_map.remove_horizontal_seam(pixels, seam)
+        emit('energy', started, vertical)
+
+        # The other table lost a row (or a column) and is filled again when it is needed
+        seam_tables[not vertical] = None
+        if remaining[vertical] > 1:
+            started = clock()
+            energy_data = energy_map.energy
+            seam_tables[vertical].remove_seam(energy_data if vertical else energy_data.T, seam)
+            emit('update', started, vertical)
+
+        if seam_log is not None:
+            seam_log.append((vertical, seam, seam_energy))
+        removed_energy += seam_energy
+        emit('seam', pass_started, vertical, seam_energy)
+        remaining[vertical] -= 1
+        removed += 1
+
+    for vertical, target, current in ((True, width, pixels.shape[1]), (False, height, pixels.shape[0])):
+        if target > current:
+            pixels, _ = enlarge_image(pixels, target - current, vertical, workers, verbose, observer=observer,
+                                      energy_function=energy_function)
+
+    return pixels, removed_energy
+
+
+def enlarge_image(pixels, num_seams_to_insert, vertical=True, workers=1, verbose=True, seam_log=None,
+                  observer=None, energy_function=DEFAULT_ENERGY):
+    """
+    Widen the image by 'num_seams_to_insert' pixels (or heighten it, with
+    'vertical=False') by stretching its lowest-energy seams. The seams are all
+    found at once with 'seam_engine.find_seams', from one energy computation and
+    one memoization table, and inserted in a single pass with
+    'seam_engine.insert_seams'. Searching again after every inserted seam would
+    only find the same seam every time, as stretching it adds no energy.
+
+    A pass stretches at most half of the image, so that no seam is stretched
+    twice and the result does not smear. Larger enlargements (and images where
+    not enough separate seams are found) take a few passes, each one on the
+    image enlarged by the passes before.
+
+    'workers', 'verbose', 'seam_log', 'observer' and 'energy_function' are the
+    same as for 'carve_seams'. Returns a tuple (pixels, inserted_energy) with the enlarged
+    image and the sum of the energies of the stretched seams.
+
+    """
+    pixels = as_pixel_array(pixels)
+    observer = ObserverGroup(ProgressPrinter(verb='Inserted') if verbose else None, observer)
+    clock = time.perf_counter
+
+    def emit(stage, started, energy=None):
+        image_rows, image_cols = (rows, cols) if vertical else (cols, rows)
+        observer(CarvingEvent(stage, inserted, count, num_seams_to_insert, image_rows, image_cols, vertical,
+                              clock() - started, energy, None))
+
+    # Seams run along the rows of the (possibly transposed) working view
+    seam_pixels = pixels if vertical else pixels.transpose(1, 0, 2)
+    workspace = SeamWorkspace()
+    inserted = 0
+    inserted_energy = 0
+
+    while inserted < num_seams_to_insert:
+        rows, cols = seam_pixels.shape[:2]
+        count = min(num_seams_to_insert - inserted, max(cols // 2, 1))
+        pass_started = clock()
+
+        started = clock()
+        energy_data = compute_energy(seam_pixels, workers, energy_function)
+        emit('energy', started)
+
+        started = clock()
+        seams, seam_energies = find_seams(energy_data, count, workspace, workers)
+        count = seams.shape[1]
+        pass_energy = int(np.sum(seam_energies))
+        emit('dp', started, pass_energy)
+
+        started = clock()
+        seam_pixels = insert_seams(seam_pixels, seams)
+        emit('insertion', started)
+
+        if seam_log is not None:
+            seam_log.append((seams, list(seam_energies)))
+        inserted_energy += pass_energy
+        emit('seam', pass_started, pass_energy)
+        inserted += count
+
+    return (seam_pixels if vertical else seam_pixels.transpose(1, 0, 2)), inserted_energy
+
+
+def carving_drift(pixels, num_seams_to_remove, seams_per_pass=1, vertical=True,
+                  pyramid_levels=0, pyramid_band=DEFAULT_PYRAMID_BAND, workers=1, energy_function=DEFAULT_ENERGY):
+    """
+    Compare an approximate carving (removing seams 'seams_per_pass' at a time,
+    and/or searching for them coarse-to-fine with 'pyramid_levels') with
+    removing the exact lowest-energy seams one at a time (without saving any
+    snapshots), with the given 'energy_function'. Returns a dictionary with:
+
+      - 'mean_abs_difference': the mean absolute difference of the two images,
+        over all pixels and channels (0 means identical, 255 the largest),
+      - 'changed_pixels': the fraction of pixels that differ,
+      - 'exact_energy' and 'approximate_energy': the summed energies of the
+        removed seams, and 'energy_ratio', the second divided by the first (1
+        when both are 0).
+
+    """
+    # Checked before the exact carving, so that a wrong setting does not cost a whole run first
+    check_approximation(seams_per_pass, pyramid_levels)
+    pixels = as_pixel_array(pixels)
+
+    exact, exact_energy = carve_seams(
+        pixels, num_seams_to_remove, vertical, SeamSnapshots('off'), workers=workers, verbose=False,
+        energy_function=energy_function
+    )
+    approximate, approximate_energy = carve_seams(
+        pixels, num_seams_to_remove, vertical, SeamSnapshots('off'), seams_per_pass,
+        pyramid_levels=pyramid_levels, pyramid_band=pyramid_band, workers=workers, verbose=False,
+        energy_function=energy_function
+    )
+
+    difference = np.abs(exact.astype(np.int16) - approximate.astype(np.int16))
+
+    return {
+        'mean_abs_difference': float(difference.mean()),
+        'changed_pixels': float(difference.any(axis=2).mean()),
+        'exact_energy': exact_energy,
+        'approximate_energy': approximate_energy,
+        'energy_ratio': approximate_energy / exact_energy if exact_energy else float(approximate_energy == 0),
+    }
@@ -8,8 +8,20 @@ representing pixels
 
 
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 
-from utils import Color, read_image_into_array, write_array_into_image
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils import as_color_rows, as_pixel_array, read_image, shift_out_seam, write_image
+
+
+# The integer type used for energy values (and the seam sums built from them)
+ENERGY_DTYPE = np.int64
+
+# The highest energy a pixel can have: the full 0-255 difference in all three channels, in both directions
+MAX_PIXEL_ENERGY = 6 * 255 ** 2
 
 
 def energy_cal(pixels, x, y):
@@ -21,6 +33,10 @@ def energy_cal(pixels, x, y):
     of the image, the current position is used whenever a "surrounding position"
     would go out of bounds.
 
+    The pixels can be an (H, W, 3) array or the older list of rows of `Color`.
+    Only the four neighbours are read from either, so calling this for every
+    pixel of a list-based image does not convert the whole image every time.
+
     """
     # Finding out the number of rows in the image
     rows = len(pixels)
@@ -55,43 +71,605 @@ def energy_cal(pixels, x, y):
 
     '''
     We are defining the energy of the pixel as the magnitude of the rate of change of colors (R,G,B)
-    at that pixel. 
+    at that pixel. The channels are widened to signed integers first so that the differences
+    of the uint8 values do not wrap around.
     '''
-    #'delta_red' represents the magnitude of change of red color with its neighboring pixels for the current pixel
-    delta_red = ((pixels[x_below][y].r-pixels[x_above][y].r)*(pixels[x_below][y].r-pixels[x_above][y].r))+((pixels[x][y_left].r-pixels[x][y_right].r)*(pixels[x][y_left].r-pixels[x][y_right].r))
-    #'delta_red' represents the magnitude of change of green color with its neighboring pixels for the current pixel
-    delta_green = ((pixels[x_below][y].g-pixels[x_above][y].g)*(pixels[x_below][y].g-pixels[x_above][y].g))+((pixels[x][y_left].g-pixels[x][y_right].g)*(pixels[x][y_left].g-pixels[x][y_right].g))
-    #'delta_red' represents the magnitude of change of blue color with its neighboring pixels for the current pixel
-    delta_blue = ((pixels[x_below][y].b-pixels[x_above][y].b)*(pixels[x_below][y].b-pixels[x_above][y].b))+((pixels[x][y_left].b-pixels[x][y_right].b)*(pixels[x][y_left].b-pixels[x][y_right].b))
-    
+    if isinstance(pixels, np.ndarray):
+        def neighbour(row, column):
+            return pixels[row, column].astype(np.int64)
+    else:
+        def neighbour(row, column):
+            color = pixels[row][column]
+            return np.array((color.r, color.g, color.b), dtype=np.int64)
+
+    # 'delta_x' represents the change of (R,G,B) between the pixels below and above the current pixel
+    delta_x = neighbour(x_below, y) - neighbour(x_above, y)
+    # 'delta_y' represents the change of (R,G,B) between the pixels to the left and right of the current pixel
+    delta_y = neighbour(x, y_left) - neighbour(x, y_right)
+
     # Energy at current pixel = delta_red+delta_blue+delta_green
-    return delta_red+delta_blue+delta_green
+    return int((delta_x * delta_x).sum() + (delta_y * delta_y).sum())
+
+def pad_pixels(pixels, border=1):
+    """
+    Widen the (H, W, 3) pixels to signed integers and replicate the edge pixels
+    'border' times on every side of the image. Looking up a neighbour in the
+    padded array is then the same as clamping the neighbour position to the
+    image, which is exactly how 'energy_cal' handles the edges.
+
+    """
+
+    return np.pad(
+        as_pixel_array(pixels).astype(np.int32),
+        ((border, border), (border, border), (0, 0)),
+        mode='edge'
+    )
+
+
+def dual_gradient_energy(padded):
+    """
+    Compute the dual gradient energy for every pixel of an edge-padded image
+    (see `pad_pixels`). The input has the shape (..., H + 2, W + 2, 3) and the
+    result has the shape (..., H, W), so a stack of padded patches can be
+    processed in one call as well.
+
+    Each neighbour is a shifted view of the padded array, so the whole image is
+    handled with a handful of array operations instead of a loop per pixel.
+
+    """
+
+    # Difference of the (R,G,B) values between the pixels below and above every pixel
+    delta_x = padded[..., 2:, 1:-1, :] - padded[..., :-2, 1:-1, :]
+    # Difference of the (R,G,B) values between the pixels to the left and right of every pixel
+    delta_y = padded[..., 1:-1, :-2, :] - padded[..., 1:-1, 2:, :]
+
+    # Energy at every pixel = delta_red+delta_blue+delta_green
+    return (
+        (delta_x * delta_x).sum(axis=-1, dtype=ENERGY_DTYPE)
+        + (delta_y * delta_y).sum(axis=-1, dtype=ENERGY_DTYPE)
+    )
+
+
+def _weighted_gradient_energy(padded, side, center):
+    """
+    The squared magnitude of a 3x3 gradient kernel with the weights (side,
+    center, side) across the direction of the difference, summed over the
+    channels. The input is edge-padded by one pixel, like for
+    'dual_gradient_energy', and the result has the same shape.
+
+    """
+
+    # The differences across every pixel, for every row (and every column) of the padded image
+    across_cols = padded[..., :, 2:, :] - padded[..., :, :-2, :]
+    across_rows = padded[..., 2:, :, :] - padded[..., :-2, :, :]
+
+    # Weighting the differences of the rows (columns) above, at and below (left of, at and right of) every pixel
+    gradient_x = side * (across_cols[..., :-2, :, :] + across_cols[..., 2:, :, :]) + center * across_cols[..., 1:-1, :, :]
+    gradient_y = side * (across_rows[..., :, :-2, :] + across_rows[..., :, 2:, :]) + center * across_rows[..., :, 1:-1, :]
+
+    return (
+        (gradient_x * gradient_x).sum(axis=-1, dtype=ENERGY_DTYPE)
+        + (gradient_y * gradient_y).sum(axis=-1, dtype=ENERGY_DTYPE)
+    )
+
+
+def sobel_energy(padded):
+    """
+    The squared Sobel gradient magnitude (weights 1, 2, 1), summed over the channels.
+
+    """
+
+    return _weighted_gradient_energy(padded, 1, 2)
+
+
+def scharr_energy(padded):
+    """
+    The squared Scharr gradient magnitude (weights 3, 10, 3), which responds
+    more evenly to edges in every direction than Sobel, summed over the channels.
+
+    """
+
+    return _weighted_gradient_energy(padded, 3, 10)
+
+
+# The luminance weights of the three channels (ITU-R BT.601), in thousandths
+LUMINANCE_WEIGHTS = (299, 587, 114)
+
+
+def luminance(pixels):
+    """
+    The luminance of (..., 3) pixels as a (..., 1) int32 array in the range 0-255,
+    so that energy kernels can work on it like on a single-channel image.
+
+    """
+
+    pixels = np.asarray(pixels)
+    red, green, blue = LUMINANCE_WEIGHTS
+    luma = red * pixels[..., 0].astype(np.int32)
+    luma += green * pixels[..., 1].astype(np.int32)
+    luma += blue * pixels[..., 2].astype(np.int32)
+    luma += 500
+    luma //= 1000
+
+    return luma[..., np.newaxis]
+
 
-def compute_energy(pixels):
+# The window of the entropy energy: the pixels up to this far away in both directions
+ENTROPY_RADIUS = 4
+
+# The luminance histogram of a window has this many bins
+ENTROPY_BINS = 16
+
+# Entropies are measured in 1/ENTROPY_SCALE bits, so that they fit the integer energies
+ENTROPY_SCALE = 1000
+
+
+def entropy_energy(padded):
+    """
+    The Shannon entropy of the luminance histogram (ENTROPY_BINS bins) of the
+    window around every pixel, in 1/ENTROPY_SCALE bits. Textured regions have a
+    high entropy, and flat or smoothly shaded regions a low one. The input is
+    the (..., H + 2r, W + 2r, 1) luminance, edge-padded by r = ENTROPY_RADIUS.
+
+    The count of every bin in every window is a box sum of the pixels in that
+    bin, taken from the 2D cumulative sum, so every bin costs a few passes over
+    the image no matter how large the window is.
+
+    """
+
+    window = 2 * ENTROPY_RADIUS + 1
+    size = window * window
+    bins = padded[..., 0] * ENTROPY_BINS // 256
+    shape = bins.shape[:-2] + (bins.shape[-2] - window + 1, bins.shape[-1] - window + 1)
+
+    # c * log2(c) for every count a bin can have in a window
+    counts = np.arange(size + 1)
+    count_log_count = counts * np.log2(np.maximum(counts, 1))
+
+    # The sum of c * log2(c) over the bins of every window
+    total = np.zeros(shape)
+    summed = np.zeros(bins.shape[:-2] + (bins.shape[-2] + 1, bins.shape[-1] + 1), dtype=np.int32)
+    for value in range(ENTROPY_BINS):
+        np.cumsum(np.cumsum(bins == value, axis=-2, dtype=np.int32), axis=-1, out=summed[..., 1:, 1:])
+        in_window = (summed[..., window:, window:] - summed[..., :-window, window:]
+                     - summed[..., window:, :-window] + summed[..., :-window, :-window])
+        total += count_log_count[in_window]
+
+    # The entropy of a window of 'size' pixels is log2(size) - sum(c * log2(c)) / size
+    entropy = np.log2(size) - total / size
+    return np.rint(entropy * ENTROPY_SCALE).astype(ENERGY_DTYPE)
+
+
+class EnergyFunction:
+    """
+    An energy function for the registry: a 'kernel' that computes the energy of
+    every pixel of a whole edge-padded image at once, and what the rest of the
+    carving needs to know about it:
+
+      - 'radius': how far the kernel looks from every pixel (the padding it needs),
+      - 'cross': whether it only looks along the row and the column of every pixel
+        (like the dual gradient) instead of at the whole square around it, which
+        decides how many pixels a removed seam changes (see 'energy_band'),
+      - 'max_energy': the highest energy a pixel can have,
+      - 'single_channel': whether the kernel works on the luminance only, which is
+        computed once from the three channels (see 'luminance').
+
+    The kernel takes an array of shape (..., H + 2 * radius, W + 2 * radius, C),
+    as produced by 'pad', and returns the (..., H, W) energies. It has to give
+    the same energies for the transposed image, transposed, since horizontal
+    seams are searched for in the transposed energy.
+
+    """
+
+    def __init__(self, name, kernel, radius=1, cross=False, max_energy=MAX_PIXEL_ENERGY, single_channel=False,
+                 description=''):
+        self.name = name
+        self.kernel = kernel
+        self.radius = radius
+        self.cross = cross
+        self.max_energy = max_energy
+        self.single_channel = single_channel
+        self.description = description
+
+    def __repr__(self):
+        return f'EnergyFunction({self.name!r})'
+
+    def channels(self, pixels):
+        """
+        The (..., C) int32 values the kernel works on: the luminance for a
+        single-channel function, otherwise the three channels.
+
+        """
+
+        if self.single_channel:
+            return luminance(pixels)
+        return np.asarray(pixels).astype(np.int32)
+
+    def pad(self, pixels):
+        """
+        The channels of the (H, W, 3) pixels, with the edge pixels replicated
+        'radius' times on every side (see 'pad_pixels').
+
+        """
+
+        border = self.radius
+        return np.pad(self.channels(as_pixel_array(pixels)), ((border, border), (border, border), (0, 0)),
+                      mode='edge')
+
+    def __call__(self, padded):
+        return self.kernel(padded)
+
+    def compute(self, pixels):
+        """
+        The (H, W) energy of the whole image.
+
+        """
+
+        return self.kernel(self.pad(pixels))
+
+    def band(self, seam, width):
+        """
+        The columns whose energy can change when the given seam is removed (see 'energy_band').
+
+        """
+
+        return energy_band(seam, width, self.radius, self.cross)
+
+
+# The energy functions by name
+ENERGY_FUNCTIONS = {}
+
+DEFAULT_ENERGY = 'dual_gradient'
+
+
+def register_energy_function(energy_function):
+    """
+    Add an 'EnergyFunction' to the registry, so that it can be selected by
+    name everywhere an energy function can be. Returns it.
+
+    """
+
+    ENERGY_FUNCTIONS[energy_function.name] = energy_function
+    return energy_function
+
+
+def get_energy_function(energy_function=DEFAULT_ENERGY):
+    """
+    The registered 'EnergyFunction' with the given name (an 'EnergyFunction'
+    is returned as it is).
+
+    """
+
+    if isinstance(energy_function, EnergyFunction):
+        return energy_function
+    try:
+        return ENERGY_FUNCTIONS[energy_function]
+    except KeyError:
+        raise ValueError(f'Unknown energy function {energy_function!r}, '
+                         f'expected one of {", ".join(ENERGY_FUNCTIONS)}') from None
+
+
+register_energy_function(EnergyFunction(
+    'dual_gradient', dual_gradient_energy, cross=True,
+    description='squared differences of the neighbours across every pixel, in all three channels (the default)'
+))
+register_energy_function(EnergyFunction(
+    'sobel', sobel_energy, max_energy=3 * 2 * (4 * 255) ** 2,
+    description='squared Sobel gradient magnitude, in all three channels'
+))
+register_energy_function(EnergyFunction(
+    'scharr', scharr_energy, max_energy=3 * 2 * (16 * 255) ** 2,
+    description='squared Scharr gradient magnitude, in all three channels'
+))
+register_energy_function(EnergyFunction(
+    'luminance', dual_gradient_energy, cross=True, max_energy=2 * 255 ** 2, single_channel=True,
+    description='the dual gradient of the luminance only, a third of the work of the default'
+))
+register_energy_function(EnergyFunction(
+    'entropy', entropy_energy, radius=ENTROPY_RADIUS, max_energy=int(np.log2(ENTROPY_BINS)) * ENTROPY_SCALE,
+    single_channel=True,
+    description=f'entropy of the luminance in the {2 * ENTROPY_RADIUS + 1}x{2 * ENTROPY_RADIUS + 1} window around every pixel'
+))
+
+
+def add_energy_argument(parser, help=None):
+    """
+    Add the '--energy' option of the carving scripts, which picks one of
+    ENERGY_FUNCTIONS, to an argparse parser (or argument group). 'help'
+    replaces the default description.
+
+    """
+    if help is None:
+        help = f'the energy of the pixels that seams avoid (default {DEFAULT_ENERGY}; luminance is the fastest)'
+    parser.add_argument('--energy', choices=list(ENERGY_FUNCTIONS), default=DEFAULT_ENERGY, help=help)
+
+
+def compute_energy(pixels, workers=1, energy_function=DEFAULT_ENERGY):
     """
     This function is to calculate the energy values at every pixel in the image
     and return the 2D array of numbers represents the corresponding energies for 
-    every pixel as output
+    every pixel as output. The result is an (H, W) int64 array holding exactly
+    the values 'energy_cal' returns for every position.
+
+    'energy_function' selects another energy from the registry, by name or as
+    an 'EnergyFunction' (see ENERGY_FUNCTIONS); the default is the dual gradient
+    of 'energy_cal'.
+
+    With 'workers' larger than 1, large images are split into horizontal strips
+    that are computed by a pool of that many processes (see
+    'compute_energy_in_strips').
 
     """
-    # Finding the number of rows in the image
-    rows = len(pixels)
-    # Finding the number of columns in the image
-    col = len(pixels[0])
 
-    # Initializing a list which finally stores the energy values of the image
-    energy = []
-    for i in range(0,rows):
-        temp = []
-        for j in range(0,col):
-            curr = energy_cal(pixels,i,j) # Using the 'energy_cal' function to calculate the energy of every pixel
-            temp.append(curr)
-        energy.append(temp)
-    
-    # After calculating the energies of all pixels in the image, return the 2D list of numbers stores in 'energy'
+    energy_function = get_energy_function(energy_function)
+
+    if workers > 1:
+        return compute_energy_in_strips(pixels, workers, energy_function)
+
+    return energy_function.compute(pixels)
+
+
+# Images with fewer rows than this per worker are not worth splitting into strips
+MIN_ROWS_PER_STRIP = 64
+
+# The process pools of 'compute_energy_in_strips', kept for the whole run by their number of workers
+_energy_pools = {}
+
+
+def _energy_pool(workers):
+    if workers not in _energy_pools:
+        _energy_pools[workers] = ProcessPoolExecutor(max_workers=workers)
+    return _energy_pools[workers]
+
+
+def _attach_shared_array(name, shape, dtype):
+    """
+    Attach to a shared memory block created by the parent process and view it
+    as an array. The block is owned (and unlinked) by the parent.
+
+    """
+
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _energy_strip(pixels_name, energy_name, shape, start, stop, energy_function):
+    """
+    Compute rows start..stop of the energy, in a worker process, from the
+    pixels in shared memory into the energy in shared memory.
+
+    """
+
+    rows, cols = shape
+    pixels_block, pixels = _attach_shared_array(pixels_name, (rows, cols, 3), np.uint8)
+    energy_block, energy = _attach_shared_array(energy_name, (rows, cols), ENERGY_DTYPE)
+    try:
+        # The strip plus 'radius' rows above and below it (repeating the edge rows of the image)
+        border = energy_function.radius
+        row_index = np.clip(np.arange(start - border, stop + border), 0, rows - 1)
+        padded = np.pad(energy_function.channels(pixels[row_index]), ((0, 0), (border, border), (0, 0)), mode='edge')
+        energy[start:stop] = energy_function(padded)
+    finally:
+        del pixels, energy
+        pixels_block.close()
+        energy_block.close()
+
+
+def compute_energy_in_strips(pixels, workers, energy_function=DEFAULT_ENERGY):
+    """
+    Compute the same energy as 'compute_energy', split into horizontal strips
+    that are computed by a pool of 'workers' processes. The pixels are copied
+    once into shared memory and every worker writes its strip straight into a
+    shared energy array, so no pixel or energy data is pickled between the
+    processes. Every strip only needs the 'radius' rows of the image above and
+    below it (one for the dual gradient).
+
+    The pool is started on the first call and kept for the following ones.
+
+    """
+
+    pixels = as_pixel_array(pixels)
+    rows, cols = pixels.shape[:2]
+    energy_function = get_energy_function(energy_function)
+
+    strips = min(workers, rows // MIN_ROWS_PER_STRIP)
+    if strips <= 1:
+        return energy_function.compute(pixels)
+
+    pixels_block = shared_memory.SharedMemory(create=True, size=pixels.nbytes)
+    energy_block = shared_memory.SharedMemory(create=True, size=rows * cols * np.dtype(ENERGY_DTYPE).itemsize)
+    try:
+        shared_pixels = np.ndarray((rows, cols, 3), dtype=np.uint8, buffer=pixels_block.buf)
+        shared_pixels[...] = pixels
+        shared_energy = np.ndarray((rows, cols), dtype=ENERGY_DTYPE, buffer=energy_block.buf)
+
+        bounds = np.linspace(0, rows, strips + 1).astype(int).tolist()
+        pool = _energy_pool(workers)
+        jobs = [
+            pool.submit(_energy_strip, pixels_block.name, energy_block.name, (rows, cols), start, stop,
+                        energy_function)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        for job in jobs:
+            job.result()
+
+        energy = shared_energy.copy()
+        del shared_pixels, shared_energy
+    finally:
+        pixels_block.close()
+        pixels_block.unlink()
+        energy_block.close()
+        energy_block.unlink()
+
     return energy
 
 
+def energy_band(seam, width, radius=1, cross=True):
+    """
+    Find the columns (in the image after the seam was removed) whose energy
+    can differ from before, for every row of a vertical seam. A pixel's energy
+    changes when its left or right neighbour changes, which happens right next
+    to the seam, or when its neighbour above or below changes, which happens
+    between the seam positions of two adjacent rows.
+
+    'radius' and 'cross' describe the neighbours of an energy function (see
+    'EnergyFunction'): those up to 'radius' pixels away along the row and the
+    column of the pixel, or with cross=False, in the whole square around it.
+
+    Returns the first column of the band for every row and the band width.
+
+    """
+
+    seam = np.asarray(seam, dtype=np.intp)
+
+    # Seam positions of the 'radius' rows above and below every row (the edge rows use their own position)
+    window = sliding_window_view(np.pad(seam, radius, mode='edge'), 2 * radius + 1)
+
+    if cross:
+        # The neighbours above and below only change between their own seam positions, and
+        # the neighbours in the row within 'radius' pixels of the seam
+        others = np.delete(window, radius, axis=1)
+        lo = np.minimum(others.min(axis=1), seam - radius)
+        hi = np.maximum(others.max(axis=1) - 1, seam + radius - 1)
+    else:
+        # Every neighbour changes within 'radius' pixels of the seam of its own row
+        lo = window.min(axis=1) - radius
+        hi = window.max(axis=1) + radius - 1
+
+    band_width = min(int((hi - lo).max()) + 1, width)
+    start = np.clip(lo, 0, width - band_width)
+
+    return start, band_width
+
+
+class EnergyMap:
+    """
+    The energy of an image that is carried across seam removals. After a seam
+    is removed only the narrow band of pixels next to it is recomputed, so
+    removing N seams from a W-wide image costs O(N*H) energy work instead of
+    O(N*H*W). The values always match a full 'compute_energy' of the current
+    image.
+
+    Seams are dropped in place: the map keeps its first allocation and only
+    shrinks its logical size, so no memory is allocated during a run. The
+    'vertical' flag tells which direction most seams will be removed in, and
+    stores the map so that those removals shift contiguous rows. Full
+    computations are split between 'workers' processes (see 'compute_energy').
+    An already computed (H, W) 'energy' of the image can be passed in instead.
+    'energy_function' selects the energy from the registry (see 'compute_energy');
+    the band recomputed around a seam grows with the radius of its kernel.
+
+    """
+
+    def __init__(self, pixels, vertical=True, workers=1, energy=None, energy_function=DEFAULT_ENERGY):
+        pixels = as_pixel_array(pixels)
+        self._vertical = vertical
+        self._workers = workers
+        self.energy_function = get_energy_function(energy_function)
+
+        if energy is not None:
+            # Copied, since the map changes its energy in place
+            energy = np.asarray(energy, dtype=ENERGY_DTYPE)
+            self._energy = np.array(energy if vertical else energy.T, order='C')
+        elif vertical:
+            self._energy = compute_energy(pixels, workers, self.energy_function)
+        else:
+            # The energy is symmetric in the two directions, so the energy of the
+            # transposed image is the transposed energy
+            self._energy = compute_energy(pixels.transpose(1, 0, 2), workers, self.energy_function)
+        self._rows, self._cols = self._energy.shape
+
+    @property
+    def energy(self):
+        """
+        The current (H, W) energy, as a view into the map.
+
+        """
+
+        energy = self._energy[:self._rows, :self._cols]
+        return energy if self._vertical else energy.T
+
+    def refresh(self, pixels):
+        """
+        Recompute the whole energy map for the given pixels (for example after
+        several seams were removed at once), reusing the map's memory.
+
+        """
+
+        pixels = as_pixel_array(pixels)
+        energy = compute_energy(pixels if self._vertical else pixels.transpose(1, 0, 2), self._workers,
+                                self.energy_function)
+
+        self._rows, self._cols = energy.shape
+        self._energy[:self._rows, :self._cols] = energy
+
+    def remove_vertical_seam(self, pixels, seam_vertical_path):
+        """
+        Drop the given vertical seam (one column per row) from the energy map
+        and recompute the band around it. 'pixels' is the image after the seam
+        has been removed from it.
+
+        """
+
+        _remove_seam_and_update(self.energy, as_pixel_array(pixels), seam_vertical_path, self.energy_function)
+
+        if self._vertical:
+            self._cols -= 1
+        else:
+            self._rows -= 1
+
+    def remove_horizontal_seam(self, pixels, seam_horizontal_path):
+        """
+        Drop the given horizontal seam (one row per column) from the energy
+        map and recompute the band around it. 'pixels' is the image after the
+        seam has been removed from it.
+
+        The energy is symmetric in the two directions, so this is the vertical
+        update applied to transposed views.
+
+        """
+
+        _remove_seam_and_update(
+            self.energy.T, as_pixel_array(pixels).transpose(1, 0, 2), seam_horizontal_path, self.energy_function
+        )
+
+        if self._vertical:
+            self._rows -= 1
+        else:
+            self._cols -= 1
+
+
+def _remove_seam_and_update(energy, pixels, seam, energy_function):
+    """
+    Remove a vertical seam from the (H, W) 'energy' view in place and
+    recompute the energy band around it from the already carved (H, W - 1)
+    'pixels' with the given 'EnergyFunction'. Afterwards the first W - 1
+    columns of 'energy' hold the new map.
+
+    """
+
+    rows, cols = energy.shape
+
+    # Dropping the seam from the energy map (every other value simply shifts left)
+    shift_out_seam(energy, seam)
+    energy = energy[:, :cols - 1]
+
+    if cols == 1:
+        return
+
+    start, band_width = energy_function.band(seam, cols - 1)
+
+    # Gathering, for every row, the band plus 'radius' pixels of (clamped) neighbours
+    # on every side, and computing the energy of the whole stack in one go
+    border = energy_function.radius
+    row_index = np.clip(np.arange(rows)[:, np.newaxis] + np.arange(-border, border + 1), 0, rows - 1)
+    col_index = np.clip(start[:, np.newaxis] + np.arange(-border, band_width + border), 0, cols - 2)
+    patches = energy_function.channels(pixels[row_index[:, :, np.newaxis], col_index[:, np.newaxis, :]])
+
+    band_cols = start[:, np.newaxis] + np.arange(band_width)
+    energy[np.arange(rows)[:, np.newaxis], band_cols] = energy_function(patches)[:, 0, :]
+
+
 def energy_image(energy_data):
     """
     Convert the energy values at each pixel into colors that can be used to
@@ -101,53 +679,56 @@ def energy_image(energy_data):
       2. Convert these values into grayscale colors, where the RGB values are
          all the same for a single color.
 
-    """
+    The result is an (H, W, 3) pixel array; 'energy_image_rows' returns the
+    older list of rows of `Color` instead.
 
-    # Initializing the 'grayscale_image' 2D list to save the energy_image into it.
-    grayscale_image = [[0 for _ in row] for row in energy_data]
+    """
+    energy_data = np.asarray(energy_data)
 
     # Finding the maximum energy value in the image to normalize energy at every pixel later
-    max_energy= (-1)*(sys.maxsize)
-    for x in range(len(grayscale_image)):
-        for y in range(len(grayscale_image[0])):
-            max_energy = max(max_energy,energy_data[x][y])
-
-    #print(energy_data[0][0])
-
-    for x in range(len(energy_data)):
-        for y in range(len(energy_data[0])):
-            energy = energy_data[x][y]
-            
-            # Normalizing energy at every pixel by diving (energy_at_current_pixel)/(max_energy)
-            # and multiplyinh it with 255 to color the image in grayscale
-            energy_normalized = round(energy / max_energy * 255)
-            grayscale_image[x][y] = Color(
-                energy_normalized,
-                energy_normalized,
-                energy_normalized
-            )
-    # Returning the grayscale enrgy image
-    return grayscale_image
+    max_energy = energy_data.max()
+
+    # Normalizing energy at every pixel by diving (energy_at_current_pixel)/(max_energy)
+    # and multiplyinh it with 255 to color the image in grayscale. A completely flat
+    # image has no energy anywhere, so it is simply drawn black.
+    if max_energy > 0:
+        energy_normalized = np.round(energy_data / max_energy * 255).astype(np.uint8)
+    else:
+        energy_normalized = np.zeros(energy_data.shape, dtype=np.uint8)
+
+    # Returning the grayscale enrgy image, with the same value in all three channels
+    return np.repeat(energy_normalized[:, :, np.newaxis], 3, axis=2)
+
+
+def energy_image_rows(energy_data):
+    """
+    The grayscale energy image of 'energy_image' as a list of rows of `Color`,
+    for the callers that index it as energy_pixels[x][y].
+
+    """
+
+    return as_color_rows(energy_image(energy_data))
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        print(f'USAGE: {__file__} <input> <output>')
+    if len(sys.argv) not in (3, 4) or (len(sys.argv) == 4 and sys.argv[3] not in ENERGY_FUNCTIONS):
+        print(f'USAGE: {__file__} <input> <output> [{"|".join(ENERGY_FUNCTIONS)}]')
         sys.exit(1)
 
     input_filename = sys.argv[1] # The input filename will be given as 1st argument
     output_filename = sys.argv[2] # The output filename will be given as 2nd argument
+    energy_name = sys.argv[3] if len(sys.argv) == 4 else DEFAULT_ENERGY # The energy function can be given as 3rd argument
 
     # STEP 1: Reading  the input image
     print(f'Reading {input_filename}...')
-    pixels = read_image_into_array(input_filename)
+    pixels = read_image(input_filename)
 
     # STEP 2: Computing the energy of every pixel in the input image
-    print('Computing the energy...')
-    energy_data = compute_energy(pixels)
+    print(f'Computing the {energy_name} energy...')
+    energy_data = compute_energy(pixels, energy_function=energy_name)
     energy_pixels = energy_image(energy_data)
 
     # STEP 3: Save the image to the output file name
     print(f'Saving {output_filename}')
-    write_array_into_image(energy_pixels, output_filename)
+    write_image(energy_pixels, output_filename)
 
@@ -0,0 +1,66 @@
+import argparse
+
+from carving import enlarge_image
+from energy_image import DEFAULT_ENERGY, add_energy_argument
+from instrumentation import add_observer_arguments, observer_from_arguments
+from seam_engine import visualize_seams
+from utils import read_image, write_image
+
+
+def insert_n_seams(pixels, num_seams_to_insert, vertical=True, workers=1, seam_log=None, observer=None,
+                   verbose=True, energy_function=DEFAULT_ENERGY):
+    """
+    Enlarging the image by duplicating its lowest-energy seams. All the seams are found
+    from a single energy computation and inserted in a single pass (see
+    'carving.enlarge_image'), so widening an image by n pixels does not take n passes.
+
+    'vertical' inserts vertical seams (wider image) or horizontal ones (taller image), and
+    'workers' spreads the energy and the seam search of large images over that many cores.
+    'seam_log', 'observer' and 'energy_function' are the same as for 'carving.carve_seams'.
+    """
+    enlarged_image, _ = enlarge_image(pixels, num_seams_to_insert, vertical, workers, verbose, seam_log, observer,
+                                      energy_function)
+
+    return enlarged_image
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Enlarge an image by duplicating its lowest-energy seams.')
+    parser.add_argument('input', help='the input image')
+    parser.add_argument('output', help='the output image')
+    parser.add_argument('num_seams_to_insert', type=int, help='the number of pixels to add')
+    parser.add_argument('--height', action='store_true', help='insert horizontal seams (increase the height) instead')
+    parser.add_argument('--seams-image', metavar='FILE',
+                        help='also save the input image with the seams of the first pass drawn on it')
+    add_energy_argument(parser)
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='processes for the energy and threads for the seam search of large images (default 1)')
+    add_observer_arguments(parser)
+    args = parser.parse_args()
+
+    if args.num_seams_to_insert < 0:
+        parser.error('num_seams_to_insert must be at least 0')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    observer, stats = observer_from_arguments(args)
+    vertical = not args.height
+
+    print(f'Reading {args.input}...')
+    pixels = read_image(args.input)
+    seam_log = []
+    enlarged_image = insert_n_seams(pixels, args.num_seams_to_insert, vertical, args.workers, seam_log, observer,
+                                    not args.quiet, args.energy)
+    write_image(enlarged_image, args.output)
+
+    print(f'Completed finding and inserting {args.num_seams_to_insert} {"vertical" if vertical else "horizontal"} seams')
+    print(f'Final Image saved to {args.output}')
+
+    if args.seams_image and seam_log:
+        # The seams of the first pass are in the coordinates of the input image
+        write_image(visualize_seams(pixels, seam_log[0][0], vertical), args.seams_image)
+        print(f'Seams saved to {args.seams_image}')
+
+    if stats is not None:
+        print(stats.format())
+        stats.save(args.stats)
+        print(f'Stage timings saved to {args.stats}')
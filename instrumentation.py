@@ -0,0 +1,229 @@
+"""
+
+Structured events of a carving run, for progress reports, logs and timings.
+'carving.carve_seams' reports every stage of every pass to an observer: any
+callable that takes a 'CarvingEvent'. The observers here are:
+
+  - 'null_observer', which ignores every event (for code that needs an
+    observer to call but has nothing to report),
+  - 'ProgressPrinter', which prints a line for every removed seam (what the
+    carving scripts show on the terminal),
+  - 'LoggingObserver', which sends the events to a 'logging' logger,
+  - 'StatsObserver', which sums up the time spent in every stage,
+
+and 'ObserverGroup' hands every event to several of them.
+
+"""
+
+import json
+import logging
+from collections import namedtuple
+
+
+# The stages of a pass, in the order their events are sent:
+#   - 'mark': the energy is marked (for example with an object to remove),
+#   - 'update': the memoization table is updated for the seam removed in the previous pass,
+#   - 'dp': the memoization table of the seam search is filled. The coarse-to-fine and the
+#     several-at-a-time searches send a single 'dp' event that includes their backtracking,
+#   - 'backtrack': the seam is read back out of the table,
+#   - 'snapshot': a snapshot of the seam is handed to the snapshot writer (only when one is taken),
+#   - 'removal': the seam is removed from the image (or 'insertion': the seams are inserted
+#     into it, when it is enlarged),
+#   - 'energy': the energy is updated around the removed seam (or computed again),
+#   - 'seam': the whole pass, with the energy of its seams.
+# Before the first pass, an 'energy' event and, when the table is carried across the
+# seams, a 'dp' event report the set-up.
+# 'carving.enlarge_image' sends 'energy', 'dp', 'insertion' and 'seam' for every pass.
+STAGES = ('mark', 'update', 'dp', 'backtrack', 'snapshot', 'removal', 'insertion', 'energy', 'seam')
+
+
+CarvingEvent = namedtuple('CarvingEvent', 'stage seam count total rows cols vertical seconds energy filename')
+CarvingEvent.__doc__ = """
+A stage of a carving pass:
+
+  - 'stage': one of STAGES,
+  - 'seam': the number of the first seam of the pass, counting from 0 (None
+    for the set-up before the first pass), and 'count': the seams in the pass,
+  - 'total': the number of seams the whole run removes,
+  - 'rows', 'cols': the size of the image at the start of the pass,
+  - 'vertical': whether vertical seams are removed,
+  - 'seconds': how long the stage took,
+  - 'energy': the summed energy of the seams of the pass (for the 'backtrack'
+    and 'seam' stages, and the 'dp' stage of the searches that include the
+    backtracking), otherwise None,
+  - 'filename': the file of the snapshot (for the 'snapshot' stage), otherwise None.
+
+"""
+
+
+def null_observer(event):
+    """
+    An observer that ignores every event. The carving functions take None
+    for no observer; this is for code that always wants one to call.
+
+    """
+
+
+class ObserverGroup:
+    """
+    Hands every event to each of the given observers (None entries are left out).
+
+    """
+
+    def __init__(self, *observers):
+        self.observers = [observer for observer in observers if observer is not None]
+
+    def __call__(self, event):
+        for observer in self.observers:
+            observer(event)
+
+
+class ProgressPrinter:
+    """
+    Prints a line for every removed seam (or every pass of several seams), or
+    for every inserted seam with verb='Inserted'.
+
+    """
+
+    def __init__(self, print_function=print, verb='Removed'):
+        self._print = print_function
+        self._verb = verb
+
+    def __call__(self, event):
+        if event.stage != 'seam':
+            return
+
+        if event.count == 1:
+            seams = f'seam {event.seam + 1}'
+        else:
+            seams = f'seams {event.seam + 1} to {event.seam + event.count}'
+        self._print(f'{self._verb} {seams} out of {event.total} '
+                    f'(energy {event.energy}, {event.seconds * 1000:.1f} ms)')
+
+
+class LoggingObserver:
+    """
+    Logs every event to 'logger' (by default the 'carving' logger): the whole
+    passes at 'level' and their stages at 'stage_level'. The messages are
+    'key=value' pairs, and the event itself is attached to every record as
+    'carving_event', for handlers that want the fields.
+
+    """
+
+    def __init__(self, logger=None, level=logging.INFO, stage_level=logging.DEBUG):
+        self.logger = logging.getLogger('carving') if logger is None else logger
+        self.level = level
+        self.stage_level = stage_level
+
+    def __call__(self, event):
+        level = self.level if event.stage == 'seam' else self.stage_level
+        if not self.logger.isEnabledFor(level):
+            return
+
+        fields = ' '.join(f'{name}={value}' for name, value in event._asdict().items()
+                          if value is not None and name != 'seconds')
+        self.logger.log(level, '%s seconds=%.6f', fields, event.seconds, extra={'carving_event': event})
+
+
+class StatsObserver:
+    """
+    Sums up the events of one or more carving runs: how many times every stage
+    ran and how long it took in total, at least and at most, along with the
+    number of removed seams and their summed energy. The events of the set-up
+    before the first pass are summed up as one more stage, 'setup'.
+
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.seams = 0
+        self.passes = 0
+        self.removed_energy = 0
+
+    def __call__(self, event):
+        # The set-up before the first pass is summed up on its own, so that the stages of the
+        # passes add up to the time of the passes
+        stage = 'setup' if event.seam is None else event.stage
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = {'count': 0, 'seconds': 0.0, 'min_seconds': event.seconds,
+                                                'max_seconds': event.seconds}
+        stats['count'] += 1
+        stats['seconds'] += event.seconds
+        stats['min_seconds'] = min(stats['min_seconds'], event.seconds)
+        stats['max_seconds'] = max(stats['max_seconds'], event.seconds)
+
+        if event.stage == 'seam':
+            self.passes += 1
+            self.seams += event.count
+            self.removed_energy += event.energy
+
+    def summary(self):
+        """
+        The totals as a dictionary, with the stages in the order they run and,
+        for every stage, its mean time and its share of the time of the passes.
+
+        """
+        passes_seconds = self.stages['seam']['seconds'] if 'seam' in self.stages else 0.0
+        stages = {}
+        for stage in sorted(self.stages, key=(('setup',) + STAGES).index):
+            stats = dict(self.stages[stage])
+            stats['mean_seconds'] = stats['seconds'] / stats['count']
+            stats['share'] = stats['seconds'] / passes_seconds if passes_seconds else 0.0
+            stages[stage] = stats
+
+        return {'seams': self.seams, 'passes': self.passes, 'removed_energy': self.removed_energy, 'stages': stages}
+
+    def format(self):
+        """
+        The totals as a table, one line per stage.
+
+        """
+        summary = self.summary()
+        lines = [f'{summary["seams"]} seams in {summary["passes"]} passes, removed energy {summary["removed_energy"]}',
+                 f'{"stage":10} {"count":>7} {"total s":>10} {"mean ms":>10} {"max ms":>10} {"share":>7}']
+        for stage, stats in summary['stages'].items():
+            lines.append(f'{stage:10} {stats["count"]:7} {stats["seconds"]:10.4f} {stats["mean_seconds"] * 1000:10.3f} '
+                         f'{stats["max_seconds"] * 1000:10.3f} {stats["share"]:7.1%}')
+
+        return '\n'.join(lines)
+
+    def save(self, filename):
+        """
+        Save the summary as JSON.
+
+        """
+        with open(filename, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+
+def add_observer_arguments(parser):
+    """
+    Add the instrumentation options of the carving scripts to an argparse parser.
+
+    """
+    group = parser.add_argument_group('instrumentation')
+    group.add_argument('--quiet', action='store_true', help='do not print a line for every removed seam')
+    group.add_argument('--log-events', action='store_true',
+                       help='log every stage of every seam, with its duration, to the standard error')
+    group.add_argument('--stats', metavar='FILE',
+                       help='save the time spent in every stage as JSON, and print a summary of it')
+
+
+def observer_from_arguments(args):
+    """
+    The observer asked for by the options of 'add_observer_arguments'
+    (or None), and the 'StatsObserver' it includes (or None).
+
+    """
+    logging_observer = None
+    if args.log_events:
+        logging.basicConfig(format='%(asctime)s %(name)s %(message)s')
+        logging.getLogger('carving').setLevel(logging.DEBUG)
+        logging_observer = LoggingObserver()
+
+    stats = StatsObserver() if args.stats else None
+
+    if logging_observer is None and stats is None:
+        return None, None
+    return ObserverGroup(logging_observer, stats), stats
@@ -0,0 +1,119 @@
+"""
+
+Steering the seams with masks laid over the energy. A keep-region (a face, a
+logo) is a boolean mask of pixels the seams go around whenever they can, and a
+priority mask holds a soft weight for every pixel, from -1 (remove first) to 1
+(keep). Both are turned once into a single integer overlay, laid out like the
+carving buffer, which 'carving.carve_seams' adds to the energy with one array
+operation before every seam search and shrinks along with every removed seam,
+so the mask images are neither read again nor recomputed during a run.
+
+As images, a keep-region is the bright pixels of a mask image, and a priority
+mask is a grayscale image where black is -1, mid-gray (128) is 0 and white is 1.
+
+"""
+
+import numpy as np
+
+from energy_image import ENERGY_DTYPE
+from utils import read_image
+
+
+def read_keep_mask(filename):
+    """
+    Read a keep-region mask image: its bright pixels (above half of the
+    highest value, in any channel) are the pixels to keep.
+
+    """
+    return read_image(filename).max(axis=2) > 127
+
+
+def read_priority_mask(filename):
+    """
+    Read a grayscale priority mask image as (H, W) weights from -1 to 1.
+
+    """
+    gray = read_image(filename).mean(axis=2)
+    return np.clip((gray - 128) / 127, -1, 1)
+
+
+def overlay_unit(max_energy, priority=None):
+    """
+    The largest amount a pixel can add to a seam without any keep-region or
+    object: its energy (at most 'max_energy') plus, with a priority mask, a
+    weight between -max_energy and max_energy, which widens the range to
+    three times 'max_energy'.
+
+    """
+    return max_energy * (3 if priority is not None else 1)
+
+
+def energy_overlay(shape, max_energy, keep=None, priority=None, vertical=True):
+    """
+    The overlay of the given (H, W) keep-region and priority masks of an image
+    of the given (H, W) shape, for an energy whose pixels are at most
+    'max_energy' (see 'energy_image.EnergyFunction'). It is laid out so that
+    the seams run along its rows, so it is transposed for horizontal seams
+    (vertical=False), like the carving buffer:
+
+      - the priority weights are scaled to +-max_energy, so a weight of 1
+        doubles the highest energy a pixel can have,
+      - every kept pixel adds more than any seam can collect anywhere else, so
+        a seam that crosses fewer kept pixels is always the cheaper one.
+
+    Returns None when neither mask is given.
+
+    """
+    if keep is None and priority is None:
+        return None
+
+    shape = tuple(shape)
+    overlay = np.zeros(shape, dtype=ENERGY_DTYPE)
+    # The length of a seam
+    rows = shape[0] if vertical else shape[1]
+
+    if priority is not None:
+        priority = np.asarray(priority, dtype=np.float64)
+        if priority.shape != shape:
+            raise ValueError(f'The priority mask is {priority.shape}, but the image is {shape}')
+        np.rint(np.clip(priority, -1, 1) * max_energy, out=overlay, casting='unsafe')
+
+    if keep is not None:
+        keep = np.asarray(keep, dtype=bool)
+        if keep.shape != shape:
+            raise ValueError(f'The keep-region mask is {keep.shape}, but the image is {shape}')
+        overlay[keep] += overlay_unit(max_energy, priority) * rows + 1
+
+    return overlay if vertical else np.array(overlay.T)
+
+
+def add_overlay_arguments(parser):
+    """
+    Add the keep-region and priority mask options of the carving scripts to an
+    argparse parser.
+
+    """
+    group = parser.add_argument_group('masks')
+    group.add_argument('--keep', metavar='IMAGE',
+                       help='a mask image of the same size whose bright pixels the seams go around (faces, logos)')
+    group.add_argument('--priority', metavar='IMAGE',
+                       help='a grayscale image of the same size: darker pixels are removed first, '
+                            'brighter ones kept (mid-gray is neutral)')
+
+
+def overlays_from_arguments(args, shape):
+    """
+    The (keep, priority) masks asked for by the options of
+    'add_overlay_arguments' (each None when not given), checked against the
+    (H, W) shape of the image. Raises ValueError for a mask of another size.
+
+    """
+    keep = read_keep_mask(args.keep) if args.keep else None
+    priority = read_priority_mask(args.priority) if args.priority else None
+
+    for name, mask in (('keep-region mask', keep), ('priority mask', priority)):
+        if mask is not None and mask.shape != tuple(shape):
+            raise ValueError(f'The {name} is {mask.shape[1]}x{mask.shape[0]}, '
+                             f'but the image is {shape[1]}x{shape[0]}')
+
+    return keep, priority
@@ -1,8 +1,13 @@
-import sys
+import argparse
 
-from energy_image import compute_energy
-from seam_identification_vertical import compute_vertical_seam, visualize_seam
-from utils import Color, read_image_into_array, write_array_into_image
+from cache import DEFAULT_CACHE_BYTES, CarvingCache
+from carving import carve_seams, carving_drift
+from energy_image import DEFAULT_ENERGY, add_energy_argument
+from instrumentation import add_observer_arguments, observer_from_arguments
+from overlays import add_overlay_arguments, overlays_from_arguments
+from seam_engine import DEFAULT_PYRAMID_BAND, SEAM_CRITERIA, remove_seam
+from snapshots import SeamSnapshots
+from utils import as_pixel_array, read_image, write_image
 
 
 def remove_seam_from_image(pixels, seam_vertical_path):
@@ -12,63 +17,126 @@ def remove_seam_from_image(pixels, seam_vertical_path):
     by one pixel in each row.
 
     """
+    # Keeping every pixel in the row, except the one whose col number is equal to the column in seam_path
+    return remove_seam(as_pixel_array(pixels), seam_vertical_path)
 
-    # Getting the number of rows in the image
-    rows=len(pixels)
-    # Getting the number of columns in the image
-    cols=len(pixels[0])
-
-    new_pixels=[] # Declaring a new list to store the image after deleting the pixels in the seam
-    for i in range(rows):
-        new_list=[]
-        for j in range(cols):
-            # Appending all the pixels whose col number is not equal to column in seam_path
-            if(j!=seam_vertical_path[i]): 
-                new_list.append(pixels[i][j])
-        new_pixels.append(new_list)
-
-    return new_pixels
-
-def remove_n_seams(pixels, num_seams_to_remove):
+def remove_n_seams(pixels, num_seams_to_remove, snapshots=None, seams_per_pass=1,
+                   pyramid_levels=0, pyramid_band=DEFAULT_PYRAMID_BAND, workers=1, cache=None,
+                   observer=None, verbose=True, criterion='backward', energy_function=DEFAULT_ENERGY, keep=None,
+                   priority=None):
     """
     Removing only one seam will not be of much difference to the image. Therefore we
     input a number 'n' to remove n-seams from the image iteratively
-    """
 
+    'snapshots' (a 'snapshots.SeamSnapshots') decides which intermediate seam images are
+    saved. By default the image with the seam drawn on it is saved for every seam.
 
-    for i in range(num_seams_to_remove):
-        print(f'Removing seam {i + 1} out of {num_seams_to_remove}')
+    'seams_per_pass' trades quality for speed: up to that many non-crossing seams are found
+    from each energy computation and removed together (see 'carving.carve_seams').
+    'pyramid_levels' does the same by searching for every seam coarse-to-fine, refining it
+    within 'pyramid_band' pixels of the coarser seam at every level.
 
-        print('  STEP 1: Computing energy...')
-        energy_data = compute_energy(pixels)
-        print('  STEP 2: Finding the lowest-vertical-energy seam...')
-        seam_vertical_path, min_y_coord = compute_vertical_seam(energy_data)
-        #print(' Finding the lowest-horzontal-energy seam...')
-        #seam_horizontal_path, _ = compute_horizontal_seam(energy_data)
-        visualized_pixels = visualize_seam(pixels, seam_vertical_path)
-        print(f'  STEP 3: Saving the current vertical seam image to intermediate-{i+1}.png...')
-        write_array_into_image(visualized_pixels, f'intermediate-{i+1}.png')
+    'workers' spreads the energy and the seam search of large images over that many cores.
 
-        print('  STEP 4: Removing the displayed lowest energy seam...')
-        pixels = remove_seam_from_image(pixels, seam_vertical_path)
+    With criterion='forward', every seam is the one whose removal creates the smallest new
+    edges instead of the one with the lowest energy (exact seams only, see 'carving.carve_seams').
+    'energy_function' selects the energy of the pixels (see 'energy_image.ENERGY_FUNCTIONS').
 
-    # We get our final image after performing the above iterations for 'n' times
-    return pixels
+    'keep' (a boolean mask of pixels the seams go around) and 'priority' (weights from -1,
+    remove first, to 1, keep) steer the seams (see 'overlays').
 
-if __name__ == '__main__':
-    if len(sys.argv) != 4:
-        print(f'USAGE: {__file__} <input> <num-seams-to-remove> <output>')
-        sys.exit(1)
+    With a 'cache' (a 'cache.CarvingCache'), a run that was done before returns straight from it.
 
-    input_filename = sys.argv[1] # Input image name should be the first argument
-    output_filename = sys.argv[2] # Output image name should be the second argument
-    num_seams_to_remove = int(sys.argv[3]) # Number of iterations to perform seam reduction should be the third argument
+    Every stage of every seam is reported to 'observer' (see 'instrumentation'), and a line
+    is printed for every seam unless 'verbose' is False.
+    """
+    if snapshots is None:
+        snapshots = SeamSnapshots(filename_pattern='intermediate-{}.png')
 
-    print(f'Reading {input_filename}...')
-    pixels = read_image_into_array(input_filename)
-    seam_carved_image = remove_n_seams(pixels, num_seams_to_remove)
-    write_array_into_image(seam_carved_image, output_filename)
+    carve = carve_seams if cache is None else cache.carve
+    seam_carved_image, _ = carve(
+        pixels, num_seams_to_remove, vertical=True, snapshots=snapshots, seams_per_pass=seams_per_pass,
+        pyramid_levels=pyramid_levels, pyramid_band=pyramid_band, workers=workers, observer=observer,
+        verbose=verbose, criterion=criterion, energy_function=energy_function, keep=keep, priority=priority
+    )
 
-    print(f'Completed finding and removing {num_seams_to_remove} vertical seams')
-    print(f'Final Image saved to {output_filename}')
+    # We get our final image after performing the above iterations for 'n' times
+    return seam_carved_image
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reduce the width of an image by removing vertical seams.')
+    parser.add_argument('input', help='the input image') # Input image name should be the first argument
+    parser.add_argument('output', help='the output image') # Output image name should be the second argument
+    parser.add_argument('num_seams_to_remove', type=int, help='the number of pixels to remove') # Number of iterations to perform seam reduction should be the third argument
+    parser.add_argument('--snapshots', default='all', metavar='MODE',
+                        help="intermediate seam images to save: 'all' (default), 'every:K' for every K-th seam, "
+                             "'off', or 'overlay' for one image showing every removed seam")
+    parser.add_argument('--seams-per-pass', type=int, default=1, metavar='K',
+                        help='remove up to K seams per energy computation (faster, approximate; default 1)')
+    parser.add_argument('--pyramid-levels', type=int, default=0, metavar='N',
+                        help='search for every seam coarse-to-fine, starting N halvings down (faster, approximate; '
+                             'default 0, the exact search)')
+    parser.add_argument('--pyramid-band', type=int, default=DEFAULT_PYRAMID_BAND, metavar='B',
+                        help=f'how many pixels on each side of the coarser seam are searched at every finer level '
+                             f'(default {DEFAULT_PYRAMID_BAND})')
+    parser.add_argument('--criterion', choices=SEAM_CRITERIA, default='backward',
+                        help="what a seam costs: the energy of its pixels ('backward', default) or the energy of "
+                             "the edges its removal creates ('forward', fewer artifacts on straight lines)")
+    add_energy_argument(parser)
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='processes for the energy and threads for the seam search of large images (default 1)')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='keep energies, seams and outputs in this cache directory and reuse them across runs')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_BYTES >> 20, metavar='MB',
+                        help=f'the size limit of the cache directory (default {DEFAULT_CACHE_BYTES >> 20} MB)')
+    parser.add_argument('--report-drift', action='store_true',
+                        help='also remove the exact seams one at a time and report how far the result drifts')
+    add_overlay_arguments(parser)
+    add_observer_arguments(parser)
+    args = parser.parse_args()
+
+    if args.seams_per_pass < 1:
+        parser.error('--seams-per-pass must be at least 1')
+    if args.pyramid_levels < 0 or args.pyramid_band < 1:
+        parser.error('--pyramid-levels must be at least 0 and --pyramid-band at least 1')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.criterion == 'forward' and (args.seams_per_pass > 1 or args.pyramid_levels > 0):
+        parser.error('--criterion forward cannot be used with --seams-per-pass or --pyramid-levels')
+
+    observer, stats = observer_from_arguments(args)
+    cache = CarvingCache(args.cache, args.cache_size << 20) if args.cache else None
+
+    try:
+        snapshots = SeamSnapshots.from_option(args.snapshots, filename_pattern='intermediate-{}.png')
+    except ValueError as error:
+        parser.error(str(error))
+
+    print(f'Reading {args.input}...')
+    pixels = read_image(args.input)
+    try:
+        keep, priority = overlays_from_arguments(args, pixels.shape[:2])
+    except ValueError as error:
+        parser.error(str(error))
+    seam_carved_image = remove_n_seams(pixels, args.num_seams_to_remove, snapshots, args.seams_per_pass,
+                                       args.pyramid_levels, args.pyramid_band, args.workers, cache,
+                                       observer, not args.quiet, args.criterion, args.energy, keep, priority)
+    write_image(seam_carved_image, args.output)
+
+    print(f'Completed finding and removing {args.num_seams_to_remove} vertical seams')
+    print(f'Final Image saved to {args.output}')
+
+    if stats is not None:
+        print(stats.format())
+        stats.save(args.stats)
+        print(f'Stage timings saved to {args.stats}')
+
+    if args.report_drift:
+        drift = carving_drift(pixels, args.num_seams_to_remove, args.seams_per_pass, vertical=True,
+                              pyramid_levels=args.pyramid_levels, pyramid_band=args.pyramid_band,
+                              workers=args.workers, energy_function=args.energy)
+        print(f'Drift from removing the seams one at a time: '
+              f'mean absolute difference {drift["mean_abs_difference"]:.3f}, '
+              f'{drift["changed_pixels"]:.1%} of the pixels changed, '
+              f'removed seam energy {drift["approximate_energy"]} instead of {drift["exact_energy"]} '
+              f'({drift["energy_ratio"]:.3f}x)')
@@ -1,8 +1,15 @@
-import sys
+import argparse
 
-from energy_image import compute_energy
-from seam_identification_vertical import compute_vertical_seam, visualize_seam
-from utils import Color, read_image_into_array, write_array_into_image
+import numpy as np
+
+from cache import DEFAULT_CACHE_BYTES, CarvingCache, array_key
+from carving import carve_seams
+from energy_image import DEFAULT_ENERGY, add_energy_argument
+from instrumentation import add_observer_arguments, observer_from_arguments
+from overlays import add_overlay_arguments, overlays_from_arguments
+from seam_engine import SEAM_CRITERIA, remove_seam
+from snapshots import SeamSnapshots
+from utils import as_pixel_array, read_image, write_image
 
 def identify_object(energy_data,row1,row2,col1,col2,num):
 
@@ -15,12 +22,23 @@ def identify_object(energy_data,row1,row2,col1,col2,num):
 
     min_energy_value = -10000000 #Declaring a minimum energy value
 
-    for i in range(row1,row2+1): 
-        for j in range(col1,col2+1-num): # Subtracting the 'num' value so as to avoid out of bound exception
-            energy_data[i][j]=min_energy_value # Changing the energy values for the corresponding pixels of the object
+    # Changing the energy values for the corresponding pixels of the object in one go. Subtracting
+    # the 'num' value as the box shrinks by one column with every removed seam
+    energy_data[row1:row2+1, col1:max(col2+1-num, col1)] = min_energy_value
     
     return energy_data
 
+def object_marker(row1, row2, col1, col2):
+    '''
+    The 'mark_energy' function for 'carving.carve_seams' that marks the object
+    in the given box before every seam search.
+    '''
+
+    def mark_object(energy_data, seam_number):
+        return identify_object(energy_data,row1,row2,col1,col2,seam_number)
+
+    return mark_object
+
 def remove_seam_from_image(pixels, seam_vertical_path):
     """
     Remove pixels from the image for the specific y-coordinates in the
@@ -28,69 +46,233 @@ def remove_seam_from_image(pixels, seam_vertical_path):
     by one pixel in each row.
 
     """
+    # Keeping every pixel in the row, except the one whose col number is equal to the column in seam_path
+    return remove_seam(as_pixel_array(pixels), seam_vertical_path)
+
+def remove_n_seams(pixels, num_seams_to_remove, row1, row2, col1, col2, snapshots=None, workers=1, cache=None,
+                   observer=None, verbose=True, criterion='backward', energy_function=DEFAULT_ENERGY):
+    """
+    Remove the object in the box from (row1, col1) to (row2, col2), both included.
+    The box is turned into a mask and removed by 'remove_object_mask', like
+    'remove_object.py' does, so the same box always gives the same image: the
+    carving stops once none of the box is left, and 'num_seams_to_remove' is no
+    longer used (it is kept for the callers that pass it).
+
+    'snapshots' (a 'snapshots.SeamSnapshots') decides which intermediate seam images are
+    saved. By default the image with the seam drawn on it is saved for every seam.
+
+    'workers' spreads the energy and the seam search of large images over that many cores.
 
-    # Getting the number of rows in the image
-    rows=len(pixels)
-    # Getting the number of columns in the image
-    cols=len(pixels[0])
+    With a 'cache' (a 'cache.CarvingCache'), a run that was done before returns straight from it.
 
-    new_pixels=[] # Declaring a new list to store the image after deleting the pixels in the seam
-    for i in range(rows):
-        new_list=[]
-        for j in range(cols):
-            # Appending all the pixels whose col number is not equal to column in seam_path
-            if(j!=seam_vertical_path[i]): 
-                new_list.append(pixels[i][j])
-        new_pixels.append(new_list)
+    Every stage of every seam is reported to 'observer' (see 'instrumentation'), and a line
+    is printed for every seam unless 'verbose' is False.
 
-    return new_pixels
+    'criterion' and 'energy_function' are the same as for 'remove_object_mask'.
+    """
+    pixels = as_pixel_array(pixels)
+    seam_carved_image, _ = remove_object_mask(pixels, box_mask(pixels.shape, row1, row2, col1, col2),
+                                              snapshots=snapshots, workers=workers, cache=cache,
+                                              observer=observer, verbose=verbose, criterion=criterion,
+                                              energy_function=energy_function)
+
+    # We get our final image once the whole object is removed
+    return seam_carved_image
 
-def remove_n_seams(pixels, num_seams_to_remove, row1, row2, col1, col2):
+def box_mask(shape, row1, row2, col1, col2):
     """
-    Removing only one seam will not be of much difference to the image. Therefore we
-    input a number 'n' to remove n-seams from the image iteratively
+    A mask of the given (H, W) shape covering the box from (row1, col1) to
+    (row2, col2), both included.
+
+    """
+    mask = np.zeros(shape[:2], dtype=bool)
+    mask[row1:row2 + 1, col1:col2 + 1] = True
+    return mask
+
+def read_mask(filename):
     """
+    Read a mask image: its bright pixels (above half of the highest value, in
+    any channel) are the object to remove.
 
+    """
+    return read_image(filename).max(axis=2) > 127
 
-    for i in range(num_seams_to_remove):
-        print(f'Removing seam {i + 1} out of {num_seams_to_remove}')
+def mask_passes(mask):
+    """
+    The number of seams needed to remove the whole mask at least, vertically
+    and horizontally: every seam takes at most one pixel from every row (or
+    column), so it is the largest number of masked pixels in a row (or column).
+    More are needed when parts of the mask are too far apart for one seam.
 
-        print('  STEP 1: Computing energy...')
-        energy_data = compute_energy(pixels)
-        print('  STEP 2: Identifying the object to be removed...')
-        energy_data = identify_object(energy_data,row1,row2,col1,col2,i)
-        print('  STEP 3: Finding the lowest-vertical-energy seam...')
-        seam_vertical_path, min_y_coord = compute_vertical_seam(energy_data)
-        #print(' Finding the lowest-horzontal-energy seam...')
-        #seam_horizontal_path, _ = compute_horizontal_seam(energy_data)
-        visualized_pixels = visualize_seam(pixels, seam_vertical_path)
-        print(f'  STEP 4: Saving the current vertical seam image to intermediate-{i+1}.jpg...')
-        write_array_into_image(visualized_pixels, f'intermediate-{i+1}.jpg')
+    """
+    mask = np.asarray(mask, dtype=bool)
+    return int(mask.sum(axis=1).max(initial=0)), int(mask.sum(axis=0).max(initial=0))
 
-        print('  STEP 5: Removing the displayed lowest energy seam...')
-        pixels = remove_seam_from_image(pixels, seam_vertical_path)
+def object_window(mask, vertical=True, margin=0):
+    """
+    The window around the object that vertical (or horizontal) seams need to
+    remove it: the range [start, stop) of the columns (or rows) of the mask,
+    widened by 'margin' pixels on both sides. Returns None for an empty mask.
 
-    # We get our final image after performing the 'n' iterations
-    return pixels
+    """
+    mask = np.asarray(mask, dtype=bool)
+    # The columns (or rows) that have any of the object in them
+    lines = np.flatnonzero(mask.any(axis=0 if vertical else 1))
+    if len(lines) == 0:
+        return None
+
+    return max(int(lines[0]) - margin, 0), min(int(lines[-1]) + 1 + margin, mask.shape[1 if vertical else 0])
+
+def remove_object_mask(pixels, mask, vertical=None, snapshots=None, workers=1, cache=None, observer=None,
+                       verbose=True, margin=None, criterion='backward', energy_function=DEFAULT_ENERGY, keep=None,
+                       priority=None):
+    """
+    Remove the object under the (H, W) boolean mask from the image. Seams are
+    steered through the object and removed until none of it is left; the mask
+    shrinks along with the image. With 'vertical' left as None, vertical or
+    horizontal seams are chosen, whichever needs fewer of them (see 'mask_passes').
+
+    With a 'margin', only the window of the object's columns (or rows) plus that
+    many pixels on each side is carved, across the whole height (or width), and
+    the rest of the image is put back around it once at the end. The work then
+    depends on the size of the object instead of the size of the image, but the
+    seams cannot leave the window, and its edges get the energy of the edge of
+    an image. Snapshots show the window only.
+
+    With criterion='forward', the seams through the object are the ones whose removal
+    creates the smallest new edges (see 'carving.carve_seams'). 'energy_function'
+    selects the energy of the pixels (see 'energy_image.ENERGY_FUNCTIONS'). 'keep' and
+    'priority' are (H, W) masks of pixels to keep and of weights that steer the other
+    seams (see 'overlays'); a seam only crosses kept pixels to take more of the object.
+
+    'snapshots', 'workers', 'cache', 'observer' and 'verbose' are the same as for
+    'remove_n_seams'. Returns a tuple (pixels, vertical) with the carved image and
+    the direction of the seams that were removed.
+    """
+    if snapshots is None:
+        snapshots = SeamSnapshots(filename_pattern='intermediate-{}.jpg')
+
+    pixels = as_pixel_array(pixels)
+    mask = np.asarray(mask, dtype=bool)
+    if vertical is None:
+        vertical_passes, horizontal_passes = mask_passes(mask)
+        vertical = vertical_passes <= horizontal_passes
+
+    window = None
+    if margin is not None:
+        window = object_window(mask, vertical, margin)
+        if window is None:
+            # There is nothing to remove
+            return pixels, vertical
+        axis = 1 if vertical else 0
+        start, stop = window
+        # The image and the mask inside the window, as views along the carved axis
+        region = (slice(None), slice(start, stop)) if vertical else (slice(start, stop),)
+        pixels, outside = pixels[region], pixels
+        mask = mask[region]
+        keep = None if keep is None else np.asarray(keep)[region]
+        priority = None if priority is None else np.asarray(priority)[region]
+
+    # At most every column (or row) but one can go; the carving stops as soon as the mask is empty
+    max_seams = pixels.shape[1 if vertical else 0] - 1
+
+    if cache is None:
+        seam_carved_image, _ = carve_seams(
+            pixels, max_seams, vertical=vertical, snapshots=snapshots, mask=mask, workers=workers,
+            observer=observer, verbose=verbose, criterion=criterion, energy_function=energy_function,
+            keep=keep, priority=priority
+        )
+    else:
+        seam_carved_image, _ = cache.carve(
+            pixels, max_seams, vertical=vertical, snapshots=snapshots, mask=mask, workers=workers,
+            observer=observer, verbose=verbose, criterion=criterion, energy_function=energy_function,
+            keep=keep, priority=priority, mark_params=['mask', array_key(mask)]
+        )
+
+    if window is not None:
+        # Every seam took one pixel from every row (or column) of the window, so the carved
+        # window fits back between the untouched parts of the image
+        before = outside[:, :start] if vertical else outside[:start]
+        after = outside[:, stop:] if vertical else outside[stop:]
+        seam_carved_image = np.concatenate([before, seam_carved_image, after], axis=axis)
+
+    return seam_carved_image, vertical
 
 if __name__ == '__main__':
-    if len(sys.argv) != 7:
-        print(f'USAGE: {__file__} <input> <num-seams-to-remove> <output>')
-        sys.exit(1)
-
-    input_filename = sys.argv[1] # Input image name should be the first argument
-    output_filename = sys.argv[2] # Output image name should be the second argument
-    row1 = int(sys.argv[3]) # Row from where the object is starting
-    row2 = int(sys.argv[4]) # Row where the object is ending
-    col1 = int(sys.argv[5]) # Column from where the object is starting
-    col2 = int(sys.argv[6]) # Column from where the object is ending
-    num_seams_to_remove = col2-col1-1 # Number of iterations to perform seam reduction which is equal the no. of columns to be removed (vertical seam carving)
-
-    print(f'Reading {input_filename}...')
-    pixels = read_image_into_array(input_filename)
-    seam_carved_image = remove_n_seams(pixels, num_seams_to_remove,row1,row2,col1,col2)
-    write_array_into_image(seam_carved_image, output_filename)
-
-    print(f'Completed finding and removing {num_seams_to_remove} vertical seams')
-    print(f'Final Image saved to {output_filename}')
+    parser = argparse.ArgumentParser(description='Remove an object (in a box or under a mask) from an image by removing seams through it.')
+    parser.add_argument('input', help='the input image') # Input image name should be the first argument
+    parser.add_argument('output', help='the output image') # Output image name should be the second argument
+    parser.add_argument('row1', type=int, nargs='?', help='row from where the object is starting')
+    parser.add_argument('row2', type=int, nargs='?', help='row where the object is ending')
+    parser.add_argument('col1', type=int, nargs='?', help='column from where the object is starting')
+    parser.add_argument('col2', type=int, nargs='?', help='column where the object is ending')
+    parser.add_argument('--mask', metavar='IMAGE',
+                        help='a mask image of the same size whose bright pixels are the object (instead of the box)')
+    parser.add_argument('--direction', choices=('auto', 'vertical', 'horizontal'), default='auto',
+                        help='the seams to remove the object with (default auto: whichever needs fewer seams)')
+    parser.add_argument('--window-margin', type=int, metavar='PX',
+                        help="only carve the object's columns (or rows) plus PX pixels on each side, which is "
+                             "much faster for a small object in a large image (default: carve the whole image)")
+    parser.add_argument('--snapshots', default='all', metavar='MODE',
+                        help="intermediate seam images to save: 'all' (default), 'every:K' for every K-th seam, "
+                             "'off', or 'overlay' for one image showing every removed seam")
+    parser.add_argument('--criterion', choices=SEAM_CRITERIA, default='backward',
+                        help="what a seam costs: the energy of its pixels ('backward', default) or the energy of "
+                             "the edges its removal creates ('forward', fewer artifacts on straight lines)")
+    add_energy_argument(parser)
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='processes for the energy and threads for the seam search of large images (default 1)')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='keep energies, seams and outputs in this cache directory and reuse them across runs')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_BYTES >> 20, metavar='MB',
+                        help=f'the size limit of the cache directory (default {DEFAULT_CACHE_BYTES >> 20} MB)')
+    add_overlay_arguments(parser)
+    add_observer_arguments(parser)
+    args = parser.parse_args()
+
+    box = (args.row1, args.row2, args.col1, args.col2)
+    if args.mask is None and None in box:
+        parser.error('either the box of the object (row1 row2 col1 col2) or --mask is required')
+    if args.mask is not None and box != (None,) * 4:
+        parser.error('the box of the object and --mask cannot be used together')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.window_margin is not None and args.window_margin < 0:
+        parser.error('--window-margin must be at least 0')
+
+    observer, stats = observer_from_arguments(args)
+    cache = CarvingCache(args.cache, args.cache_size << 20) if args.cache else None
+
+    try:
+        snapshots = SeamSnapshots.from_option(args.snapshots, filename_pattern='intermediate-{}.jpg')
+    except ValueError as error:
+        parser.error(str(error))
+
+    print(f'Reading {args.input}...')
+    pixels = read_image(args.input)
+    if args.mask is not None:
+        mask = read_mask(args.mask)
+        if mask.shape != pixels.shape[:2]:
+            parser.error(f'the mask is {mask.shape[1]}x{mask.shape[0]}, but the image is '
+                         f'{pixels.shape[1]}x{pixels.shape[0]}')
+    else:
+        mask = box_mask(pixels.shape, *box)
+    try:
+        keep, priority = overlays_from_arguments(args, pixels.shape[:2])
+    except ValueError as error:
+        parser.error(str(error))
+
+    vertical = {'auto': None, 'vertical': True, 'horizontal': False}[args.direction]
+    seam_carved_image, vertical = remove_object_mask(pixels, mask, vertical, snapshots, args.workers, cache,
+                                                     observer, not args.quiet, args.window_margin, args.criterion,
+                                                     args.energy, keep, priority)
+    write_image(seam_carved_image, args.output)
+
+    num_seams_removed = pixels.shape[1 if vertical else 0] - seam_carved_image.shape[1 if vertical else 0]
+    print(f'Completed finding and removing {num_seams_removed} {"vertical" if vertical else "horizontal"} seams')
+    print(f'Final Image saved to {args.output}')
 
+    if stats is not None:
+        print(stats.format())
+        stats.save(args.stats)
+        print(f'Stage timings saved to {args.stats}')
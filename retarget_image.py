@@ -0,0 +1,55 @@
+import argparse
+
+from carving import retarget
+from energy_image import DEFAULT_ENERGY, add_energy_argument
+from instrumentation import add_observer_arguments, observer_from_arguments
+from utils import read_image, write_image
+
+
+def retarget_image(pixels, width, height, workers=1, observer=None, verbose=True, energy_function=DEFAULT_ENERGY):
+    """
+    Carving the image to an exact width and height in a single run. Vertical and horizontal
+    seams are interleaved, and at every step the one with the lower energy is removed
+    (see 'carving.retarget'), instead of first reducing the width and then the height.
+
+    'workers' spreads the energy and the seam search of large images over that many cores,
+    and 'observer' and 'energy_function' are the same as for 'carving.carve_seams'.
+    """
+    retargeted_image, _ = retarget(pixels, width, height, workers, verbose, observer=observer,
+                                   energy_function=energy_function)
+
+    return retargeted_image
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Carve an image to a given width and height, '
+                                                 'removing the cheaper of a vertical and a horizontal seam each time.')
+    parser.add_argument('input', help='the input image')
+    parser.add_argument('output', help='the output image')
+    parser.add_argument('width', type=int, help='the width of the output image')
+    parser.add_argument('height', type=int, help='the height of the output image')
+    add_energy_argument(parser)
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='processes for the energy and threads for the seam search of large images (default 1)')
+    add_observer_arguments(parser)
+    args = parser.parse_args()
+
+    if args.width < 1 or args.height < 1:
+        parser.error('the width and the height must be at least 1')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    observer, stats = observer_from_arguments(args)
+
+    print(f'Reading {args.input}...')
+    pixels = read_image(args.input)
+    retargeted_image = retarget_image(pixels, args.width, args.height, args.workers, observer, not args.quiet,
+                                      args.energy)
+    write_image(retargeted_image, args.output)
+
+    print(f'Completed retargeting from {pixels.shape[1]}x{pixels.shape[0]} to {args.width}x{args.height}')
+    print(f'Final Image saved to {args.output}')
+
+    if stats is not None:
+        print(stats.format())
+        stats.save(args.stats)
+        print(f'Stage timings saved to {args.stats}')
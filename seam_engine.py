@@ -0,0 +1,844 @@
+"""
+
+The seam search and seam removal shared by both seam directions. Everything here
+works on vertical seams (one column per row); horizontal seams are handled by
+passing transposed views (`array.T` for energies, `pixels.transpose(1, 0, 2)`
+for images), which NumPy creates without copying any data. Horizontal carving
+therefore runs exactly the same code as vertical carving, without rotating
+the image for every seam.
+
+"""
+
+import threading
+
+import numpy as np
+
+from energy_image import DEFAULT_ENERGY, ENERGY_DTYPE, get_energy_function
+from utils import as_pixel_array, shift_out_seam, shift_out_seams
+
+
+class SeamWorkspace:
+
+    """
+
+    Preallocated buffers for the seam search: the cumulative seam energy of every
+    cell (an integer array) and the back pointer of every cell, stored as an int8
+    offset (-1, 0 or +1) to the parent in the previous row. One workspace can be
+    passed to every search of a 'remove_n_seams' run; the buffers are only
+    reallocated when a larger image comes along.
+
+    """
+    def __init__(self):
+        self._cost = np.empty(0, dtype=ENERGY_DTYPE)
+        self._back = np.empty(0, dtype=np.int8)
+
+    def buffers(self, rows, cols):
+        """
+        Return (cost, back) views of shape (rows, cols) into the workspace.
+
+        """
+        size = rows * cols
+        if self._cost.size < size:
+            self._cost = np.empty(size, dtype=ENERGY_DTYPE)
+            self._back = np.empty(size, dtype=np.int8)
+
+        return self._cost[:size].reshape(rows, cols), self._back[:size].reshape(rows, cols)
+
+
+def dp_step(prev_cost, energy_line, cost_line, back_line):
+
+    """
+
+    Fill one row of the memoization table from the row before it, for all cells at
+    once. The parent is picked with the same rules (and the same tie-breaking) as
+    picking it cell by cell:
+
+      - the cell to the left wins ties against the cell straight above,
+      - the cell to the right is only picked when it is strictly smaller,
+      - except in the 0th column, where the cell to the right wins ties against
+        the cell straight above.
+
+    """
+    # Starting with the cell straight above as the parent of every cell
+    np.copyto(cost_line, prev_cost)
+    back_line.fill(0)
+
+    # Moving top and left, when it is not larger than the cell above
+    take = prev_cost[:-1] <= cost_line[1:]
+    np.copyto(cost_line[1:], prev_cost[:-1], where=take)
+    np.copyto(back_line[1:], -1, where=take)
+
+    # Moving top and right, when it is smaller than the best cell so far
+    take = prev_cost[1:] < cost_line[:-1]
+    np.copyto(cost_line[:-1], prev_cost[1:], where=take)
+    np.copyto(back_line[:-1], 1, where=take)
+
+    # In the 0th column the cell to the right also wins a tie with the cell above
+    if len(prev_cost) > 1 and prev_cost[1] == prev_cost[0]:
+        back_line[0] = 1
+
+    cost_line += energy_line
+
+
+def backtrack(back_pointers, end_col):
+    """
+    Follow the back pointers from the given column of the last row up to the
+    0th row, and return the column of the seam in every row.
+
+    """
+    rows = len(back_pointers)
+
+    seam = np.empty(rows, dtype=np.intp)
+    col = int(end_col)
+    for i in range(rows - 1, -1, -1):
+        seam[i] = col
+        col += int(back_pointers[i, col])
+
+    return seam
+
+
+# Rows narrower than this many columns per thread are not split between threads,
+# since handing the chunks out would cost more than it saves
+MIN_COLS_PER_THREAD = 2048
+
+
+def fill_rows(cost, back_pointers, energy_data, workers=1):
+    """
+    Fill rows 1 to H - 1 of the given (H, W) memoization table from its 0th row.
+
+    With 'workers' larger than 1, every row is split into that many chunks of
+    columns (as long as each chunk has at least MIN_COLS_PER_THREAD columns),
+    which are filled by separate threads. The NumPy kernels of 'dp_step'
+    release the GIL, so the chunks really run in parallel; the threads only
+    wait for each other at the end of every row, since every row needs the
+    whole row above it. The result is the same as filling the table serially.
+
+    """
+    rows, cols = cost.shape
+    threads = max(min(workers, cols // MIN_COLS_PER_THREAD), 1)
+
+    if threads == 1 or rows == 1:
+        for i in range(1, rows):
+            dp_step(cost[i - 1], energy_data[i], cost[i], back_pointers[i])
+        return
+
+    bounds = np.linspace(0, cols, threads + 1).astype(int).tolist()
+    end_of_row = threading.Barrier(threads)
+    errors = []
+
+    def fill_chunk(start, stop):
+        # One more column on each side, so that every cell of the chunk has all of its parents
+        first, last = max(start - 1, 0), min(stop + 1, cols)
+        cost_line = np.empty(last - first, dtype=ENERGY_DTYPE)
+        back_line = np.empty(last - first, dtype=np.int8)
+
+        try:
+            for i in range(1, rows):
+                dp_step(cost[i - 1, first:last], energy_data[i, first:last], cost_line, back_line)
+                cost[i, start:stop] = cost_line[start - first:stop - first]
+                back_pointers[i, start:stop] = back_line[start - first:stop - first]
+                end_of_row.wait()
+        except threading.BrokenBarrierError:
+            # Another chunk failed, and its error is raised below
+            pass
+        except BaseException as error:
+            errors.append(error)
+            end_of_row.abort()
+
+    chunk_threads = [
+        threading.Thread(target=fill_chunk, args=(bounds[t], bounds[t + 1]), daemon=True)
+        for t in range(1, threads)
+    ]
+    for thread in chunk_threads:
+        thread.start()
+    # The calling thread fills the first chunk itself
+    fill_chunk(bounds[0], bounds[1])
+    for thread in chunk_threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def fill_seam_table(energy_data, workspace=None, workers=1):
+
+    """
+
+    Fill the memoization table of the given (H, W) energy array, one whole row at a
+    time (split between 'workers' threads for wide images, see 'fill_rows'). Returns
+    the (cost, back_pointers) views into the workspace: the lowest total energy of
+    a seam ending at every cell, and the offset to its parent.
+
+    """
+    energy_data = np.asarray(energy_data)
+    rows, cols = energy_data.shape
+
+    if workspace is None:
+        workspace = SeamWorkspace()
+    cost, back_pointers = workspace.buffers(rows, cols)
+
+    # The 0th row of the memoization table is the 0th row of the energy data
+    cost[0] = energy_data[0]
+    back_pointers[0] = 0
+
+    fill_rows(cost, back_pointers, energy_data, workers)
+
+    return cost, back_pointers
+
+
+def find_seam(energy_data, workspace=None, workers=1):
+
+    """
+
+    Find the lowest-energy vertical seam of the given (H, W) energy array using
+    dynamic programming. For a horizontal seam, pass the transposed energy
+    ('energy_data.T').
+
+    Returns a tuple (seam, total_energy_of_seam), where 'seam' is an array with
+    the column of the seam in every row. When several seams have the same total
+    energy, the one ending in the leftmost column is returned. 'workers' threads
+    fill the table of wide images (see 'fill_rows').
+
+    """
+    cost, back_pointers = fill_seam_table(energy_data, workspace, workers)
+
+    return seam_from_table(cost, back_pointers)
+
+
+def seam_from_table(cost, back_pointers):
+    """
+    Read the lowest-energy seam out of a filled memoization table (see
+    'fill_seam_table'), the leftmost one on ties. Returns (seam, total_energy_of_seam).
+
+    """
+    end_col = int(np.argmin(cost[-1]))
+
+    return backtrack(back_pointers, end_col), int(cost[-1, end_col])
+
+
+# The criteria a seam can be chosen by: the energy of its pixels, or the energy of the
+# edges its removal creates (see 'fill_forward_table')
+SEAM_CRITERIA = ('backward', 'forward')
+
+# The highest forward cost of a cell: the full difference of the summed channels across both new edges
+MAX_FORWARD_COST = 2 * 3 * 255
+
+
+def forward_dp_step(prev_cost, cost_left, cost_up, cost_right, cost_line, back_line):
+
+    """
+
+    Fill one row of a forward-energy memoization table from the row before it, for all
+    cells at once. Unlike 'dp_step', the cost of a cell depends on which parent the seam
+    comes from: 'cost_left', 'cost_up' and 'cost_right' are the costs of coming from the
+    cell above and to the left, straight above, and above and to the right. Parents are
+    picked with the same rules (and the same tie-breaking) as in 'dp_step'.
+
+    """
+    # Starting with the cell straight above as the parent of every cell
+    np.add(prev_cost, cost_up, out=cost_line)
+    back_line.fill(0)
+
+    # Moving top and left, when it is not more expensive than coming from above
+    from_left = prev_cost[:-1] + cost_left[1:]
+    take = from_left <= cost_line[1:]
+    np.copyto(cost_line[1:], from_left, where=take)
+    np.copyto(back_line[1:], -1, where=take)
+
+    # Moving top and right, when it is cheaper than the best parent so far
+    from_right = prev_cost[1:] + cost_right[:-1]
+    take = from_right < cost_line[:-1]
+    np.copyto(cost_line[:-1], from_right, where=take)
+    np.copyto(back_line[:-1], 1, where=take)
+
+    # In the 0th column the cell to the right also wins a tie with the cell above
+    if len(prev_cost) > 1 and from_right[0] == cost_line[0] and back_line[0] == 0:
+        back_line[0] = 1
+
+
+def fill_forward_table(intensity, workspace=None, energy_data=None):
+
+    """
+
+    Fill the memoization table of the forward-energy criterion for the given (H, W)
+    intensities (the sum of the three channels of every pixel). Instead of the energy of
+    the pixels a seam removes, a seam costs the differences across the edges its removal
+    creates: removing a pixel joins its left and right neighbours, and a seam that moves
+    left (or right) between two rows also joins the pixel above with the left (or right)
+    neighbour. Seams that leave behind the smallest new edges cause the fewest artifacts.
+
+    The three costs of every row are computed as arrays and the row is filled with
+    'forward_dp_step', so this costs about as much as 'fill_seam_table'. 'energy_data',
+    when given, is added to every cell (for example to mark an object). Returns the
+    (cost, back_pointers) views into the workspace, like 'fill_seam_table'.
+
+    """
+    intensity = np.asarray(intensity)
+    rows, cols = intensity.shape
+
+    if workspace is None:
+        workspace = SeamWorkspace()
+    cost, back_pointers = workspace.buffers(rows, cols)
+
+    # Every row with its edge pixels repeated, so that every pixel has a left and a right neighbour
+    padded = np.pad(intensity.astype(ENERGY_DTYPE), ((0, 0), (1, 1)), mode='edge')
+
+    for i in range(rows):
+        left = padded[i, :-2]
+        right = padded[i, 2:]
+        # Removing the pixel joins its left and right neighbours
+        cost_up = np.abs(right - left)
+
+        if i == 0:
+            cost[0] = cost_up
+            back_pointers[0] = 0
+        else:
+            # Coming from the left (or right) also joins the pixel above with the left (or right) neighbour
+            above = padded[i - 1, 1:-1]
+            cost_left = cost_up + np.abs(above - left)
+            cost_right = cost_up + np.abs(above - right)
+            forward_dp_step(cost[i - 1], cost_left, cost_up, cost_right, cost[i], back_pointers[i])
+
+        if energy_data is not None:
+            cost[i] += energy_data[i]
+
+    return cost, back_pointers
+
+
+def pixel_intensity(pixels):
+    """
+    The intensity of every pixel for 'fill_forward_table': the sum of its three channels.
+
+    """
+
+    return as_pixel_array(pixels).sum(axis=2, dtype=np.int32)
+
+
+def find_seam_forward(pixels, workspace=None):
+
+    """
+
+    Find the vertical seam of the (H, W, 3) image whose removal creates the smallest new
+    edges (see 'fill_forward_table'). For a horizontal seam, pass the transposed image
+    ('pixels.transpose(1, 0, 2)'). Returns a tuple (seam, forward_cost_of_seam).
+
+    """
+    cost, back_pointers = fill_forward_table(pixel_intensity(pixels), workspace)
+
+    return seam_from_table(cost, back_pointers)
+
+
+# A cost no seam can reach, for cells outside the image or outside the band of a search
+UNREACHABLE_COST = np.iinfo(ENERGY_DTYPE).max // 4
+
+# Up to this many columns, 'SeamTable' fills its whole table again after every seam instead of updating it
+MAX_COLS_FOR_REFILL = 128
+
+
+class SeamTable:
+    """
+    The memoization table of the seam search, carried across seam removals like
+    'energy_image.EnergyMap' carries the energy. After a seam is removed only the
+    cells whose cost can change are recomputed: the cells around the seam (whose
+    energy or parents changed) and, row by row, the children of every cell whose
+    cost actually changed. The recomputed region stops growing, and shrinks back
+    to the seam, wherever the new costs match the old ones, so a seam that only
+    affects a small part of the image costs a fraction of a full table. The
+    table always matches a full 'fill_seam_table' of the current energy, and
+    'find_seam' returns exactly what 'seam_engine.find_seam' would.
+
+    Like the energy map, the table is laid out so that the seams run along its
+    rows (pass transposed energies for horizontal seams), and removed seams are
+    shifted out in place. 'workers' threads fill the initial table of wide
+    images (see 'fill_rows'). 'energy_function' is the energy function of the
+    energy map (see 'energy_image.EnergyFunction'), which decides how far from
+    a removed seam the energy can change.
+
+    """
+
+    def __init__(self, energy_data, workers=1, energy_function=DEFAULT_ENERGY):
+        energy_data = np.asarray(energy_data)
+        self._rows, self._cols = energy_data.shape
+        self._energy_function = get_energy_function(energy_function)
+
+        # Every row of costs has an unreachable cell on both sides, so that the parents of
+        # any cell can be read without checking for the edges of the image
+        self._cost = np.full((self._rows, self._cols + 2), UNREACHABLE_COST, dtype=ENERGY_DTYPE)
+        self._back = np.zeros((self._rows, self._cols), dtype=np.int8)
+
+        cost = self._cost[:, 1:-1]
+        cost[0] = energy_data[0]
+        fill_rows(cost, self._back, energy_data, workers)
+
+    def find_seam(self):
+        """
+        Find the lowest-energy seam of the current table, like 'find_seam' does.
+
+        """
+
+        last_row = self._cost[-1, 1:self._cols + 1]
+        end_col = int(np.argmin(last_row))
+
+        return backtrack(self._back[:, :self._cols], end_col), int(last_row[end_col])
+
+    def remove_seam(self, energy_data, seam):
+        """
+        Drop the given seam from the table and update it for 'energy_data', the
+        (H, W - 1) energy after the seam was removed.
+
+        """
+
+        energy_data = np.asarray(energy_data)
+        cols = self._cols - 1
+        seam = np.asarray(seam, dtype=np.intp)
+        seam_cols = seam.tolist()
+
+        if cols == 0:
+            self._cols = 0
+            return
+
+        if cols <= MAX_COLS_FOR_REFILL:
+            # In a table this narrow the work of every row is all overhead, and filling the
+            # whole table again costs less than working out which cells changed
+            cost = self._cost[:, 1:cols + 1]
+            cost[0] = energy_data[0]
+            fill_rows(cost, self._back[:, :cols], energy_data)
+            self._cost[:, cols + 1] = UNREACHABLE_COST
+            self._cols = cols
+            return
+
+        # The columns whose energy may have changed (see 'energy_image.EnergyMap')
+        start, band_width = self._energy_function.band(seam, cols)
+        lo = np.minimum(start, seam)
+        hi = np.maximum(start + band_width - 1, seam)
+        # The columns whose parents are no longer the same cells as before: to the left
+        # of the seam the parents only stay the same while they are left of the seam of
+        # the row above, and to the right of it while they are right of that seam
+        above = seam[:-1]
+        lo[1:] = np.minimum(lo[1:], np.minimum(seam[1:], above - 1))
+        hi[1:] = np.maximum(hi[1:], np.maximum(seam[1:], above + 1) - 1)
+        forced_lo = np.clip(lo, 0, cols - 1).tolist()
+        forced_hi = np.clip(hi, 0, cols - 1).tolist()
+
+        # The columns of the row above whose cost changed, if any
+        changed = None
+
+        for i in range(self._rows):
+            # Dropping the seam from the row (every other cell, and the unreachable cell
+            # on the right, simply shifts left)
+            col = seam_cols[i]
+            cost = self._cost[i]
+            cost[col + 1:self._cols + 1] = cost[col + 2:self._cols + 2]
+            back = self._back[i]
+            back[col:self._cols - 1] = back[col + 1:self._cols]
+
+            lo, hi = forced_lo[i], forced_hi[i]
+            if changed is not None:
+                # Every child of a changed cell has to be recomputed too
+                lo = max(min(lo, changed[0] - 1), 0)
+                hi = min(max(hi, changed[1] + 1), cols - 1)
+
+            if i == 0:
+                new_cost = energy_data[0, lo:hi + 1]
+                new_back = 0
+            else:
+                # The parents of the columns lo..hi, offset by the unreachable cell on the left
+                prev_cost = self._cost[i - 1]
+                left = prev_cost[lo:hi + 1]
+                up = prev_cost[lo + 1:hi + 2]
+                right = prev_cost[lo + 2:hi + 3]
+
+                # The same rules as 'dp_step': left wins a tie with up, right has to be strictly smaller
+                take_left = left <= up
+                best = np.minimum(left, up)
+                take_right = right < best
+                new_cost = np.minimum(best, right)
+                new_cost += energy_data[i, lo:hi + 1]
+                new_back = np.where(take_right, 1, -take_left.view(np.int8)).astype(np.int8)
+                # In the 0th column the cell to the right also wins a tie with the cell above
+                if lo == 0 and right[0] == up[0]:
+                    new_back[0] = 1
+
+            differ = (cost[lo + 1:hi + 2] != new_cost).nonzero()[0]
+            changed = (lo + int(differ[0]), lo + int(differ[-1])) if len(differ) else None
+
+            cost[lo + 1:hi + 2] = new_cost
+            back[lo:hi + 1] = new_back
+
+        self._cols = cols
+
+
+# The default number of columns on each side of the upsampled seam that the refining search looks at
+DEFAULT_PYRAMID_BAND = 4
+
+
+def downsample_energy(energy_data):
+    """
+    Halve the resolution of an (H, W) energy array by summing every 2x2 block.
+    Odd sizes are padded by repeating the last row or column.
+
+    """
+    energy_data = np.asarray(energy_data, dtype=ENERGY_DTYPE)
+    rows, cols = energy_data.shape
+
+    padded = np.pad(energy_data, ((0, rows % 2), (0, cols % 2)), mode='edge')
+    return padded[0::2, 0::2] + padded[1::2, 0::2] + padded[0::2, 1::2] + padded[1::2, 1::2]
+
+
+def find_seam_in_band(energy_data, centers, band=DEFAULT_PYRAMID_BAND):
+    """
+    Find the lowest-energy vertical seam that stays within 'band' columns of the
+    given center column in every row. Only the (2 * band + 1)-wide band is looked
+    at, with the same parent rules as 'dp_step'. When the band covers the whole
+    width, the result is the same as 'find_seam'.
+
+    Returns a tuple (seam, total_energy_of_seam), like 'find_seam'.
+
+    """
+    energy_data = np.asarray(energy_data)
+    rows, cols = energy_data.shape
+    width = min(2 * band + 1, cols)
+
+    # The first column of the band in every row, kept inside the image
+    starts = np.clip(np.asarray(centers, dtype=np.intp) - band, 0, cols - width)
+    band_cols = starts[:, np.newaxis] + np.arange(width)
+    band_energy = energy_data[np.arange(rows)[:, np.newaxis], band_cols].astype(ENERGY_DTYPE)
+
+    # Positions (in 'prev_cost' below) of the cells above-left, above and above-right of every
+    # cell, all computed up front. 'prev_cost' holds the costs of the band of the row above
+    # between two unreachable cells, which anything outside that band is pointed to.
+    above = band_cols[1:] - starts[:-1, np.newaxis] + 1
+    up_index = np.clip(above, 0, width + 1)
+    left_index = np.clip(above - 1, 0, width + 1)
+    right_index = np.clip(above + 1, 0, width + 1)
+    # Cells in the 0th and last column of the image have no parent beyond the edge
+    left_index[band_cols[1:] == 0] = 0
+    right_index[band_cols[1:] == cols - 1] = 0
+
+    back_pointers = np.zeros((rows, width), dtype=np.int8)
+    prev_cost = np.full(width + 2, UNREACHABLE_COST, dtype=ENERGY_DTYPE)
+    cost = band_energy[0]
+
+    for i in range(1, rows):
+        prev_cost[1:-1] = cost
+        left = prev_cost[left_index[i - 1]]
+        up = prev_cost[up_index[i - 1]]
+        right = prev_cost[right_index[i - 1]]
+
+        # The same rules as 'dp_step': left wins a tie with up, right has to be strictly smaller
+        back = back_pointers[i]
+        take = left <= up
+        back[take] = -1
+        best = np.minimum(left, up)
+        take = right < best
+        back[take] = 1
+        best = np.minimum(best, right)
+        # In the 0th column the cell to the right also wins a tie with the cell above
+        if starts[i] == 0 and right[0] == up[0]:
+            back[0] = 1
+
+        cost = np.minimum(best, UNREACHABLE_COST) + band_energy[i]
+
+    end = int(np.argmin(cost))
+    total_energy = int(cost[end])
+
+    seam = np.empty(rows, dtype=np.intp)
+    col = int(starts[-1]) + end
+    for i in range(rows - 1, -1, -1):
+        seam[i] = col
+        col += int(back_pointers[i, col - starts[i]])
+
+    return seam, total_energy
+
+
+def find_seam_pyramid(energy_data, levels=2, band=DEFAULT_PYRAMID_BAND, workspace=None, workers=1):
+    """
+    Find a low-energy vertical seam coarse-to-fine. The energy is halved in resolution
+    'levels' times; the seam is searched for exactly on the smallest energy, and then,
+    level by level, upsampled and refined with 'find_seam_in_band' within 'band' columns
+    of the upsampled seam. Most of the dynamic programming is therefore done on small
+    images, but the seam found can be more expensive than the one 'find_seam' finds
+    ('pyramid_seam_gap' measures by how much). 'workers' is passed on to the exact
+    search on the smallest energy.
+
+    Returns a tuple (seam, total_energy_of_seam), like 'find_seam'. Raises
+    ValueError for a band narrower than 1 or a negative number of levels.
+
+    """
+    if band < 1:
+        raise ValueError('band must be at least 1')
+    if levels < 0:
+        raise ValueError('levels must be at least 0')
+
+    pyramid = [np.asarray(energy_data)]
+    for _ in range(levels):
+        rows, cols = pyramid[-1].shape
+        # Not halving any further than what leaves room for a seam to be refined
+        if rows < 2 or cols < 2 * (2 * band + 1):
+            break
+        pyramid.append(downsample_energy(pyramid[-1]))
+
+    seam, total_energy = find_seam(pyramid[-1], workspace, workers)
+
+    for finer in reversed(pyramid[:-1]):
+        rows, cols = finer.shape
+        # Every coarse cell covers a 2x2 block, so the seam is upsampled to the middle of it
+        centers = np.minimum(2 * seam[np.arange(rows) // 2] + 1, cols - 1)
+        seam, total_energy = find_seam_in_band(finer, centers, band)
+
+    return seam, total_energy
+
+
+def pyramid_seam_gap(energy_data, levels=2, band=DEFAULT_PYRAMID_BAND):
+    """
+    Compare the seam found by 'find_seam_pyramid' with the exact seam found by
+    'find_seam'. Returns a tuple (pyramid_energy, exact_energy, relative_gap),
+    where the gap is how much more energy the pyramid seam has (0 when it
+    found an optimal seam).
+
+    """
+    pyramid_energy = find_seam_pyramid(energy_data, levels, band)[1]
+    exact_energy = find_seam(energy_data)[1]
+
+    gap = (pyramid_energy - exact_energy) / abs(exact_energy) if exact_energy else float(pyramid_energy != 0)
+    return pyramid_energy, exact_energy, gap
+
+
+def _backtrack_between(cost, back_pointers, end_col, left, right):
+    """
+    Backtrack a seam from the given column of the last row, staying strictly
+    between the 'left' and 'right' seams (arrays with a column per row, or None
+    for the image edges). Where the back pointer leads out of that range, the
+    cheapest parent inside it is taken instead. Returns None when the range
+    closes before the 0th row is reached.
+
+    """
+    rows, cols = cost.shape
+
+    seam = np.empty(rows, dtype=np.intp)
+    col = int(end_col)
+    for i in range(rows - 1, -1, -1):
+        seam[i] = col
+        if i == 0:
+            break
+
+        low = 0 if left is None else int(left[i - 1]) + 1
+        high = cols - 1 if right is None else int(right[i - 1]) - 1
+
+        parent = col + int(back_pointers[i, col])
+        if not low <= parent <= high:
+            parents = range(max(col - 1, low), min(col + 1, high) + 1)
+            if not parents:
+                return None
+            parent = min(parents, key=lambda p: cost[i - 1, p])
+        col = parent
+
+    return seam
+
+
+def find_seams(energy_data, count, workspace=None, workers=1):
+
+    """
+
+    Find up to 'count' low-energy vertical seams that neither share a pixel nor cross
+    each other, all from a single memoization table. Seams are taken from the end cells
+    with the lowest totals first. Each one is backtracked while staying strictly between
+    the seams already taken on either side of it, falling back to its cheapest allowed
+    parent where the back pointers would lead into (or across) a neighbouring seam.
+
+    This is an approximation: after removing the first seam, the exact algorithm would
+    recompute the energy and could pick different seams. The lowest-energy seam is always
+    the first one, so at least one seam is returned. 'workers' threads fill the table of
+    wide images (see 'fill_rows').
+
+    Returns a tuple (seams, energies), where 'seams' is an (H, k) array with the column of
+    every seam in every row, sorted from left to right, and 'energies' their totals.
+
+    """
+    cost, back_pointers = fill_seam_table(energy_data, workspace, workers)
+    rows, cols = cost.shape
+    energy_data = np.asarray(energy_data)
+
+    # The taken seams, sorted from left to right (they never cross, so the order is the same in every row)
+    taken = []
+    for end_col in np.argsort(cost[-1], kind='stable').tolist():
+        ends = [seam[-1] for seam in taken]
+        position = int(np.searchsorted(ends, end_col))
+        if position < len(ends) and ends[position] == end_col:
+            continue
+
+        left = taken[position - 1] if position > 0 else None
+        right = taken[position] if position < len(taken) else None
+        seam = _backtrack_between(cost, back_pointers, end_col, left, right)
+        if seam is None:
+            continue
+
+        taken.insert(position, seam)
+        if len(taken) == count:
+            break
+
+    seams = np.stack(taken, axis=1)
+    # The totals of the seams that left their back pointers are higher than their end cell
+    energies = energy_data[np.arange(rows)[:, np.newaxis], seams].sum(axis=0, dtype=ENERGY_DTYPE)
+
+    return seams, energies
+
+
+def remove_seam(array, seam):
+    """
+    Remove one element per row at the columns given by the vertical 'seam' from
+    an (H, W, ...) array, which gives back an (H, W - 1, ...) array. Works the
+    same for images, energies and masks.
+
+    """
+    rows, cols = array.shape[:2]
+
+    # Marking every element to keep, except the one in the seam
+    keep = np.ones((rows, cols), dtype=bool)
+    keep[np.arange(rows), seam] = False
+
+    return array[keep].reshape((rows, cols - 1) + array.shape[2:])
+
+
+def insert_seams(array, seams):
+    """
+    Insert a copy of each of the given non-overlapping vertical seams, an (H, k)
+    array of columns, into an (H, W, ...) array in a single pass. The copy goes
+    right after the seam's pixel and is the average of that pixel and the one
+    to its right, so the seam is stretched into two pixels. Returns a new
+    (H, W + k, ...) array.
+
+    """
+    array = np.asarray(array)
+    rows, cols = array.shape[:2]
+    seams = np.asarray(seams, dtype=np.intp).reshape(rows, -1)
+    row_index = np.arange(rows)[:, np.newaxis]
+
+    # How many seams lie strictly left of every column, i.e. how far that column moves to the right
+    on_seam = np.zeros((rows, cols), dtype=np.intp)
+    on_seam[row_index, seams] = 1
+    shift = np.cumsum(on_seam, axis=1) - on_seam
+
+    output = np.empty((rows, cols + seams.shape[1]) + array.shape[2:], dtype=array.dtype)
+    output[row_index, np.arange(cols) + shift] = array
+
+    # The copy of every seam pixel, blended with its right neighbour (the last column has none)
+    right = np.minimum(seams + 1, cols - 1)
+    blended = (array[row_index, seams].astype(np.uint16) + array[row_index, right]) // 2
+    output[row_index, seams + shift[row_index, seams] + 1] = blended.astype(array.dtype)
+
+    return output
+
+
+class CarvingBuffer:
+    """
+    Holds the image of a carving run and removes seams from it in place. The
+    image is copied into the buffer once; every seam removal then only shifts
+    the part of each row to the right of the seam, and the buffer shrinks its
+    logical width instead of reallocating. Memory therefore stays at about one
+    image for a whole 'remove_n_seams' run.
+
+    With 'vertical=False' the buffer removes horizontal seams. It then stores
+    the image transposed, so that those removals shift contiguous rows too.
+    Seams in the other direction can be removed as well ('remove_cross_seam'),
+    which shrinks the logical height of the buffer instead.
+
+    """
+
+    def __init__(self, pixels, vertical=True):
+        pixels = as_pixel_array(pixels)
+        self.vertical = vertical
+
+        # The one copy of the image, laid out so that seams run along its rows
+        self._pixels = np.array(pixels if vertical else pixels.transpose(1, 0, 2))
+        self.height, self.width = self._pixels.shape[:2]
+
+    @property
+    def pixels(self):
+        """
+        The current image, as an (H, W, 3) view into the buffer.
+
+        """
+
+        pixels = self._pixels[:self.height, :self.width]
+        return pixels if self.vertical else pixels.transpose(1, 0, 2)
+
+    @property
+    def seam_pixels(self):
+        """
+        The current image laid out so that the seams run along its rows, i.e.
+        the image itself for vertical seams and its transpose for horizontal ones.
+
+        """
+
+        return self._pixels[:self.height, :self.width]
+
+    def remove_seam(self, seam):
+        """
+        Remove the given seam (vertical or horizontal, depending on the buffer)
+        from the image in place.
+
+        """
+
+        shift_out_seam(self._pixels[:self.height, :self.width], seam)
+        self.width -= 1
+
+    def remove_cross_seam(self, seam):
+        """
+        Remove a seam in the other direction (a horizontal seam from a buffer of
+        vertical seams, and the other way round) in place. Its pixels are
+        shifted along the columns of the buffer, which is slower than along the
+        rows.
+
+        """
+
+        shift_out_seam(self._pixels[:self.height, :self.width].transpose(1, 0, 2), seam)
+        self.height -= 1
+
+    def remove_seams(self, seams):
+        """
+        Remove several non-overlapping seams, given as an (H, k) array (like the
+        one 'find_seams' returns), from the image in place in a single pass.
+
+        """
+
+        seams = np.asarray(seams).reshape(self.height, -1)
+        shift_out_seams(self._pixels[:self.height, :self.width], seams)
+        self.width -= seams.shape[1]
+
+
+# The colors seams are drawn in: red for vertical seams and green for horizontal ones
+VERTICAL_SEAM_COLOR = (255, 0, 0)
+HORIZONTAL_SEAM_COLOR = (0, 255, 0)
+
+
+def draw_seam(pixels, seam, color, thickness=2):
+    """
+    Return a copy of the (H, W, 3) pixels with the vertical 'seam' drawn in the
+    given color. If we color only the pixels in the seam then the seam would not
+    be visible enough, so 'thickness' pixels on both sides are colored too.
+
+    Several seams can be drawn at once by passing an (H, k) array of seams.
+
+    """
+    new_pixels = np.array(pixels, dtype=np.uint8)
+    cols = new_pixels.shape[1]
+
+    seams = np.asarray(seam).reshape(len(new_pixels), -1)
+    for row, row_cols in enumerate(seams.tolist()):
+        for col in row_cols:
+            new_pixels[row, max(col - thickness, 0):min(col + thickness, cols - 1) + 1] = color
+
+    return new_pixels
+
+
+def visualize_seams(pixels, seams, vertical=True):
+    """
+    Draw the given vertical seams (in red) or horizontal seams (in green) on a
+    copy of the (H, W, 3) pixels.
+
+    """
+    if vertical:
+        return draw_seam(as_pixel_array(pixels), seams, VERTICAL_SEAM_COLOR)
+
+    return draw_seam(as_pixel_array(pixels).transpose(1, 0, 2), seams, HORIZONTAL_SEAM_COLOR).transpose(1, 0, 2)
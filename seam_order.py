@@ -0,0 +1,174 @@
+"""
+
+Precomputing the order in which seams are removed, so that the same image can be
+served at any width (or height) without running the seam search again.
+
+A seam-order index is an (H, W) array that holds, for every pixel of the original
+image, the (0-based) step at which the pixel was removed while carving vertical
+seams one at a time. Removing 'n' seams is then the same as keeping the pixels
+whose step is at least 'n', which every row has exactly W - n of. Producing any
+width is therefore a single masked gather over the image, without any energy or
+dynamic programming. Indexes for horizontal seams work the same way with rows and
+columns swapped.
+
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from energy_image import DEFAULT_ENERGY, EnergyMap, add_energy_argument
+from seam_engine import CarvingBuffer, SeamTable
+from utils import as_pixel_array, read_image, shift_out_seam, write_image
+
+
+def compute_seam_order(pixels, vertical=True, max_seams=None, energy_function=DEFAULT_ENERGY):
+    """
+    Carve the image seam by seam (vertical seams, or horizontal seams with
+    'vertical=False') and record the step at which every pixel is removed.
+
+    By default the image is carved down to a single column (or row), so that
+    every width can be produced. 'max_seams' stops earlier; pixels that are
+    never removed then get the step 'max_seams', and only sizes down to
+    W - max_seams can be produced from the index. 'energy_function' selects
+    the energy the seams are searched in (see 'energy_image.ENERGY_FUNCTIONS').
+
+    Returns the (H, W) int32 index, in the orientation of the image.
+
+    """
+    pixels = as_pixel_array(pixels)
+    carving_buffer = CarvingBuffer(pixels, vertical=vertical)
+
+    # Laid out like the carving buffer, so that the seams run along the rows
+    rows, cols = carving_buffer.seam_pixels.shape[:2]
+    num_seams = cols - 1 if max_seams is None else min(max_seams, cols - 1)
+
+    energy_map = EnergyMap(carving_buffer.pixels, vertical=vertical, energy_function=energy_function)
+    energy_data = energy_map.energy
+    seam_table = SeamTable(energy_data if vertical else energy_data.T, energy_function=energy_map.energy_function)
+
+    # The original column of every remaining pixel, which shrinks along with the image
+    original_cols = np.tile(np.arange(cols, dtype=np.int32), (rows, 1))
+    order = np.full((rows, cols), num_seams, dtype=np.int32)
+    row_index = np.arange(rows)
+
+    for step in range(num_seams):
+        seam, _ = seam_table.find_seam()
+
+        remaining_cols = original_cols[:, :carving_buffer.width]
+        order[row_index, remaining_cols[row_index, seam]] = step
+        shift_out_seam(remaining_cols, seam)
+
+        carving_buffer.remove_seam(seam)
+        if vertical:
+            energy_map.remove_vertical_seam(carving_buffer.pixels, seam)
+        else:
+            energy_map.remove_horizontal_seam(carving_buffer.pixels, seam)
+        energy_data = energy_map.energy
+        seam_table.remove_seam(energy_data if vertical else energy_data.T, seam)
+
+    return order if vertical else order.T
+
+
+def retarget_with_seam_order(pixels, order, size, vertical=True):
+    """
+    Produce the image with the given width (or height, with 'vertical=False')
+    from a seam-order index of the same direction, with a single masked gather.
+
+    """
+    pixels = as_pixel_array(pixels)
+    order = np.asarray(order)
+
+    if order.shape != pixels.shape[:2]:
+        raise ValueError(f'The seam-order index has the shape {order.shape}, but the image has {pixels.shape[:2]}')
+
+    if not vertical:
+        pixels = pixels.transpose(1, 0, 2)
+        order = order.T
+
+    rows, cols = order.shape
+    # Pixels that were never removed carry the number of seams the index was built with
+    min_size = cols - int(order.max(initial=0))
+    if not min_size <= size <= cols:
+        raise ValueError(f'The seam-order index can only produce sizes from {min_size} to {cols}, not {size}')
+
+    keep = order >= cols - size
+    new_pixels = pixels[keep].reshape(rows, size, 3)
+
+    return new_pixels if vertical else new_pixels.transpose(1, 0, 2)
+
+
+def seam_order_filename(image_filename, vertical=True):
+    """
+    The file a seam-order index is saved to, alongside its image.
+
+    """
+    return f'{image_filename}.{"vertical" if vertical else "horizontal"}-seam-order.npz'
+
+
+def save_seam_order(order, filename):
+    """
+    Save a seam-order index, using 16-bit steps whenever they fit.
+
+    """
+    order = np.asarray(order)
+    if order.max(initial=0) <= np.iinfo(np.uint16).max:
+        order = order.astype(np.uint16)
+
+    np.savez_compressed(filename, order=order)
+
+
+def load_seam_order(filename):
+    """
+    Load a seam-order index saved by 'save_seam_order'.
+
+    """
+    with np.load(filename) as data:
+        return data['order'].astype(np.int32)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute seam-order indexes and serve any width or height from them.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='compute the seam-order indexes of an image and save them alongside it')
+    build.add_argument('input', help='the input image')
+    build.add_argument('--direction', choices=('vertical', 'horizontal', 'both'), default='both',
+                       help='vertical seams (for widths), horizontal seams (for heights) or both (default)')
+    build.add_argument('--max-seams', type=int, default=None,
+                       help='stop after this many seams (only sizes down to that many pixels less can be produced)')
+    add_energy_argument(build)
+
+    retarget = commands.add_parser('retarget', help='produce the image at a new width or height from a saved index')
+    retarget.add_argument('input', help='the input image the index was built for')
+    retarget.add_argument('output', help='the output image')
+    size = retarget.add_mutually_exclusive_group(required=True)
+    size.add_argument('--width', type=int, help='the width of the output image')
+    size.add_argument('--height', type=int, help='the height of the output image')
+
+    args = parser.parse_args()
+
+    print(f'Reading {args.input}...')
+    pixels = read_image(args.input)
+
+    if args.command == 'build':
+        directions = (True, False) if args.direction == 'both' else (args.direction == 'vertical',)
+        for vertical in directions:
+            print(f'Computing the {"vertical" if vertical else "horizontal"} seam order...')
+            order = compute_seam_order(pixels, vertical, args.max_seams, args.energy)
+            index_filename = seam_order_filename(args.input, vertical)
+            save_seam_order(order, index_filename)
+            print(f'Seam order saved to {index_filename}')
+    else:
+        vertical = args.width is not None
+        index_filename = seam_order_filename(args.input, vertical)
+        if not os.path.exists(index_filename):
+            parser.error(f'There is no seam-order index at {index_filename}, run the build command first')
+        order = load_seam_order(index_filename)
+        try:
+            new_pixels = retarget_with_seam_order(pixels, order, args.width if vertical else args.height, vertical)
+        except ValueError as error:
+            parser.error(str(error))
+        write_image(new_pixels, args.output)
+        print(f'Final Image saved to {args.output}')
@@ -0,0 +1,394 @@
+"""
+
+A small HTTP service for retargeting images, so that a web tier can call the seam
+carving directly instead of launching the scripts for every image. It runs a
+thread per request ('http.server.ThreadingHTTPServer') on localhost and exposes:
+
+  - POST /width?seams=N (or ?width=W): remove vertical seams,
+  - POST /height?seams=N (or ?height=H): remove horizontal seams,
+  - POST /object?row1=..&row2=..&col1=..&col2=..: remove the object in the box,
+  - GET /health: the state of the service, as JSON.
+
+The image is sent as the request body, and the carved image comes back as PNG
+(or JPEG with ?format=jpeg). Every response carries the content hash of the
+image in 'X-Image-Key'; later requests can send that as ?image=KEY with an
+empty body, as long as the image is still cached.
+
+Recently used images are kept in memory together with their seam-order indexes
+(see 'seam_order'): the first width (or height) request carves the image once,
+and every other size up to that many seams is a single masked gather. The cache
+is limited in bytes and evicts the least recently used images, and a limited
+number of requests are carved at the same time; the rest are turned away with
+503 once they have waited too long.
+
+"""
+
+import argparse
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from PIL import Image
+
+from cache import array_key, image_key
+from energy_image import DEFAULT_ENERGY, add_energy_argument
+from remove_object import box_mask, remove_object_mask
+from seam_order import compute_seam_order, retarget_with_seam_order
+from snapshots import SeamSnapshots
+
+
+DEFAULT_PORT = 8765
+
+# The default size limit of the in-memory cache
+DEFAULT_CACHE_BYTES = 512 << 20
+
+# The default number of requests that are carved at the same time
+DEFAULT_MAX_CONCURRENT = 4
+
+# How long a request waits for its turn before it is turned away
+DEFAULT_QUEUE_TIMEOUT = 30.0
+
+# Uploads larger than this are refused
+DEFAULT_MAX_UPLOAD_BYTES = 64 << 20
+
+OUTPUT_FORMATS = {'png': ('PNG', 'image/png'), 'jpeg': ('JPEG', 'image/jpeg'), 'jpg': ('JPEG', 'image/jpeg')}
+
+
+class RequestError(Exception):
+    """
+    An error that is answered with the given HTTP status.
+
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class CachedImage:
+    """
+    A decoded image with the seam data computed for it so far: a seam-order
+    index per direction and the results of object removals.
+
+    """
+
+    def __init__(self, pixels):
+        self.pixels = pixels
+        self.orders = {}
+        self.objects = {}
+        # Held while the seam data of this image is computed, so it is only computed once
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        # Summed over snapshots of the dictionaries, which requests may add to meanwhile (under the
+        # image's lock, which is not taken here so that the cache is never held up by a carving)
+        return (self.pixels.nbytes + sum(order.nbytes for order in list(self.orders.values()))
+                + sum(result.nbytes for result in list(self.objects.values())))
+
+
+class ImageCache:
+    """
+    The least recently used images, with their seam data, up to 'max_bytes'.
+
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._images.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def add(self, key, pixels):
+        """
+        Return the cached image with the given key, adding it when it is not
+        cached yet.
+
+        """
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = CachedImage(pixels)
+            self._images.move_to_end(key)
+            return self._images[key]
+
+    def shrink(self):
+        """
+        Evict the least recently used images until the cache is within its
+        limit (the most recent one always stays).
+
+        """
+        with self._lock:
+            total = sum(image.nbytes for image in self._images.values())
+            while total > self.max_bytes and len(self._images) > 1:
+                _, image = self._images.popitem(last=False)
+                total -= image.nbytes
+
+    def stats(self):
+        with self._lock:
+            return {
+                'images': len(self._images),
+                'bytes': sum(image.nbytes for image in self._images.values()),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+class RetargetService:
+    """
+    The work behind the HTTP endpoints, independent of the HTTP plumbing.
+
+    """
+
+    def __init__(self, cache_bytes=DEFAULT_CACHE_BYTES, max_concurrent=DEFAULT_MAX_CONCURRENT,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT, energy_function=DEFAULT_ENERGY):
+        self.cache = ImageCache(cache_bytes)
+        # The energy function of every carving, the same for the whole server so that cached results stay valid
+        self.energy_function = energy_function
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def image(self, body, key=None):
+        """
+        The cached image for the uploaded body, or for the key of an image that
+        was uploaded before. Returns (key, cached_image, cache_hit).
+
+        """
+        if not body:
+            if key is None:
+                raise RequestError(400, 'Send an image as the request body, or ?image=KEY for a cached one')
+            image = self.cache.get(key)
+            if image is None:
+                raise RequestError(404, f'The image {key} is not cached (any more), send it again')
+            return key, image, True
+
+        try:
+            with Image.open(io.BytesIO(body)) as img:
+                pixels = np.array(img.convert('RGB'), dtype=np.uint8)
+        except Exception as error:
+            raise RequestError(400, f'Could not decode the image: {error}')
+
+        key = image_key(pixels)
+        image = self.cache.get(key)
+        if image is not None:
+            return key, image, True
+        return key, self.cache.add(key, pixels), False
+
+    def retarget(self, image, vertical, seams):
+        """
+        Remove 'seams' vertical (or horizontal) seams from the cached image,
+        from its seam-order index. The index is extended when it does not go
+        that far yet. Returns (pixels, index_was_reused).
+
+        """
+        pixels = image.pixels
+        size = pixels.shape[1] if vertical else pixels.shape[0]
+        if not 0 <= seams < size:
+            raise RequestError(400, f'Cannot remove {seams} seams from an image that is {size} pixels across')
+
+        with image.lock:
+            order = image.orders.get(vertical)
+            reused = order is not None and int(order.max(initial=0)) >= seams
+            if not reused:
+                # Carving at least twice as far as before, so that a client walking through
+                # sizes does not carve the image again for every step
+                previous = 0 if order is None else int(order.max(initial=0))
+                order = compute_seam_order(pixels, vertical, min(max(seams, 2 * previous), size - 1),
+                                           self.energy_function)
+                image.orders[vertical] = order
+
+        self.cache.shrink()
+        return retarget_with_seam_order(pixels, order, size - seams, vertical), reused
+
+    def remove_object(self, image, row1, row2, col1, col2):
+        """
+        Remove the object in the given box from the cached image, like
+        'remove_object.py' does: seams (vertical or horizontal, whichever needs
+        fewer) are removed until none of the box is left. The results are cached
+        by the content of the mask. Returns (pixels, result_was_reused).
+
+        """
+        rows, cols = image.pixels.shape[:2]
+        if not (0 <= row1 <= row2 < rows and 0 <= col1 <= col2 < cols):
+            raise RequestError(400, f'The box rows {row1}-{row2}, columns {col1}-{col2} is not inside the image')
+
+        mask = box_mask(image.pixels.shape, row1, row2, col1, col2)
+        key = ('mask', array_key(mask))
+        with image.lock:
+            result = image.objects.get(key)
+            reused = result is not None
+            if not reused:
+                carved, _ = remove_object_mask(image.pixels, mask, snapshots=SeamSnapshots('off'), verbose=False,
+                                               energy_function=self.energy_function)
+                result = image.objects[key] = carved.copy()
+
+        self.cache.shrink()
+        return result, reused
+
+    def handle(self, path, query, body):
+        """
+        Answer a request. Returns (pixels, headers) for the image to send back.
+
+        """
+        if path not in ('/width', '/height', '/object'):
+            raise RequestError(404, f'Unknown endpoint {path}, expected /width, /height, /object or /health')
+
+        def number(name, required=True):
+            values = query.get(name)
+            if not values:
+                if required:
+                    raise RequestError(400, f'The request needs ?{name}=')
+                return None
+            try:
+                return int(values[0])
+            except ValueError:
+                raise RequestError(400, f'?{name}= must be a whole number, not {values[0]!r}')
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise RequestError(503, f'All {self.max_concurrent} carving slots are busy, try again later')
+        try:
+            started = time.perf_counter()
+            key, image, image_hit = self.image(body, query.get('image', [None])[0])
+
+            if path == '/object':
+                box = [number(name) for name in ('row1', 'row2', 'col1', 'col2')]
+                pixels, reused = self.remove_object(image, *box)
+            else:
+                vertical = path == '/width'
+                target = number('width' if vertical else 'height', required=False)
+                if target is not None:
+                    size = image.pixels.shape[1] if vertical else image.pixels.shape[0]
+                    seams = size - target
+                else:
+                    seams = number('seams')
+                pixels, reused = self.retarget(image, vertical, seams)
+
+            headers = {
+                'X-Image-Key': key,
+                'X-Image-Cache': 'hit' if image_hit else 'miss',
+                'X-Seam-Cache': 'hit' if reused else 'miss',
+                'X-Seconds': f'{time.perf_counter() - started:.4f}',
+            }
+            return pixels, headers
+        finally:
+            self._slots.release()
+
+
+class RetargetHandler(BaseHTTPRequestHandler):
+    """
+    Turns HTTP requests into calls of the server's 'RetargetService'.
+
+    """
+
+    server_version = 'SeamCarving/1.0'
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode('utf-8'), 'application/json')
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/health':
+            self._send_json(404, {'error': 'Only /health can be fetched, the other endpoints take a POST'})
+            return
+
+        service = self.server.service
+        self._send_json(200, {'status': 'ok', 'max_concurrent': service.max_concurrent, 'cache': service.cache.stats()})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > self.server.max_upload_bytes:
+                raise RequestError(413, f'Uploads are limited to {self.server.max_upload_bytes} bytes')
+            body = self.rfile.read(length) if length else b''
+
+            output_format = query.get('format', ['png'])[0].lower()
+            if output_format not in OUTPUT_FORMATS:
+                raise RequestError(400, f'Unknown format {output_format!r}, expected one of {sorted(OUTPUT_FORMATS)}')
+
+            pixels, headers = self.server.service.handle(url.path, query, body)
+        except RequestError as error:
+            self._send_json(error.status, {'error': str(error)})
+            return
+        except Exception as error:
+            self._send_json(500, {'error': f'{type(error).__name__}: {error}'})
+            return
+
+        pil_format, content_type = OUTPUT_FORMATS[output_format]
+        encoded = io.BytesIO()
+        Image.fromarray(np.ascontiguousarray(pixels), 'RGB').save(encoded, pil_format)
+        self._send(200, encoded.getvalue(), content_type, headers)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(port=DEFAULT_PORT, service=None, max_upload_bytes=DEFAULT_MAX_UPLOAD_BYTES, verbose=True):
+    """
+    Create the server, bound to localhost only (port 0 picks a free port).
+    Call 'serve_forever' on it to start serving.
+
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), RetargetHandler)
+    server.daemon_threads = True
+    server.service = service or RetargetService()
+    server.max_upload_bytes = max_upload_bytes
+    server.verbose = verbose
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve seam carving over HTTP on localhost.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'the port to listen on (default {DEFAULT_PORT})')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_BYTES >> 20, metavar='MB',
+                        help=f'the size limit of the in-memory image cache (default {DEFAULT_CACHE_BYTES >> 20} MB)')
+    parser.add_argument('--max-concurrent', type=int, default=DEFAULT_MAX_CONCURRENT, metavar='N',
+                        help=f'the number of requests carved at the same time (default {DEFAULT_MAX_CONCURRENT})')
+    parser.add_argument('--queue-timeout', type=float, default=DEFAULT_QUEUE_TIMEOUT, metavar='SECONDS',
+                        help=f'how long a request waits for a free slot before a 503 (default {DEFAULT_QUEUE_TIMEOUT:g})')
+    parser.add_argument('--max-upload', type=int, default=DEFAULT_MAX_UPLOAD_BYTES >> 20, metavar='MB',
+                        help=f'the largest accepted upload (default {DEFAULT_MAX_UPLOAD_BYTES >> 20} MB)')
+    add_energy_argument(parser)
+    args = parser.parse_args()
+
+    if args.max_concurrent < 1:
+        parser.error('--max-concurrent must be at least 1')
+
+    service = RetargetService(args.cache_size << 20, args.max_concurrent, args.queue_timeout, args.energy)
+    server = make_server(args.port, service, args.max_upload << 20)
+
+    print(f'Serving on http://127.0.0.1:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,210 @@
+"""
+Intermediate seam snapshots of a carving run. Saving a snapshot of every seam
+is useful to see how the carving progresses, but encoding an image per seam
+takes most of the time of a run. 'SeamSnapshots' decides which snapshots are
+taken (all of them, every k-th one, none, or a single overlay of all removed
+seams) and hands them to a 'SnapshotWriter', which encodes them on a
+background thread so that the carving loop is not blocked.
+
+"""
+
+
+import queue
+import threading
+
+import numpy as np
+
+from utils import as_pixel_array, shift_out_seams, write_image
+
+
+SNAPSHOT_MODES = ('all', 'every', 'off', 'overlay')
+
+
+class SnapshotWriter:
+    """
+    Writes images on a background thread. At most 'max_pending' images wait to
+    be encoded; when the queue is full, 'submit' blocks until the writer catches
+    up, so a fast carving loop cannot pile up an unbounded number of copies.
+
+    """
+
+    def __init__(self, max_pending=4):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            pixels, filename = item
+            try:
+                write_image(pixels, filename)
+            except Exception as error:
+                # Keeping the first error to raise it from 'close'
+                if self._error is None:
+                    self._error = error
+
+    def submit(self, pixels, filename):
+        """
+        Queue the given pixels to be written to 'filename'. The pixels must not
+        be modified afterwards, so pass a copy of anything that keeps changing.
+
+        """
+
+        self._queue.put((pixels, filename))
+
+    def close(self):
+        """
+        Wait until every queued image is written. Raises the first error the
+        writer ran into, if any.
+
+        """
+
+        self._queue.put(None)
+        self._thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+
+class SeamSnapshots:
+    """
+    Decides which intermediate snapshots of a carving run are saved:
+
+      - 'all': the image with the seam drawn on it, for every seam,
+      - 'every': the same, but only for every 'every'-th seam (and the last one),
+      - 'off': no snapshots at all,
+      - 'overlay': a single image, written when the run is done, showing all the
+        removed seams on the original image.
+
+    Snapshot filenames are built from 'filename_pattern' with the 1-based seam
+    number. Call 'start' before the first seam and 'close' after the last one.
+
+    """
+
+    def __init__(self, mode='all', every=1, filename_pattern='intermediate-{}.png',
+                 overlay_filename='seams-overlay.png', max_pending=4):
+        if mode not in SNAPSHOT_MODES:
+            raise ValueError(f'Unknown snapshot mode {mode!r}, expected one of {SNAPSHOT_MODES}')
+        if every < 1:
+            raise ValueError(f'Snapshots can only be kept for every k-th seam with k >= 1, got {every}')
+
+        self.mode = mode
+        self.every = 1 if mode == 'all' else every
+        self.filename_pattern = filename_pattern
+        self.overlay_filename = overlay_filename
+        self.max_pending = max_pending
+
+        self._writer = None
+        self._original = None
+
+    @classmethod
+    def from_option(cls, option, **kwargs):
+        """
+        Build the snapshots from a command line option: 'all', 'off', 'overlay'
+        or 'every:K' to keep every K-th snapshot.
+
+        """
+
+        mode, _, every = option.partition(':')
+        if mode == 'every':
+            if not every.isdigit():
+                raise ValueError(f'Expected every:K with a positive number K, got {option!r}')
+            return cls('every', every=int(every), **kwargs)
+
+        return cls(mode, **kwargs)
+
+    def start(self, pixels, vertical=True):
+        """
+        Prepare for a run that removes seams (vertical or horizontal) from the
+        given pixels.
+
+        """
+
+        if self.mode == 'off':
+            return
+
+        self._writer = SnapshotWriter(self.max_pending)
+        self._vertical = vertical
+
+        if self.mode == 'overlay':
+            pixels = as_pixel_array(pixels)
+            self._original = pixels.copy()
+            rows, cols = pixels.shape[:2]
+
+            # Laid out so that the seams run along the rows, like the carving buffer does
+            if not vertical:
+                rows, cols = cols, rows
+            # The original column of every remaining pixel, which shrinks along with the image
+            self._original_cols = np.tile(np.arange(cols, dtype=np.int32), (rows, 1))
+            self._removed = np.zeros((rows, cols), dtype=bool)
+            self._width = cols
+
+    def wants(self, seam_number, num_seams, count=1):
+        """
+        Tell whether a snapshot is saved as an image of its own for the given
+        (0-based) seam, or for any of the 'count' seams starting from it when
+        several seams are removed at once.
+
+        """
+
+        if self.mode not in ('all', 'every'):
+            return False
+
+        last = seam_number + count
+        return last // self.every > seam_number // self.every or last == num_seams
+
+    def add(self, seam_number, num_seams, pixels, seam, visualize):
+        """
+        Record the seam that is about to be removed from 'pixels'. 'visualize'
+        draws the seam on the image, like 'visualize_seam' does. Several seams
+        that are removed at once can be passed as an (H, k) array. Returns the
+        filename the snapshot is saved to, or None when it is not saved.
+
+        """
+
+        seams = np.asarray(seam)
+        count = 1 if seams.ndim == 1 else seams.shape[1]
+
+        if self.mode == 'overlay':
+            original_cols = self._original_cols[:, :self._width]
+            seams = seams.reshape(len(original_cols), count)
+            rows = np.arange(len(original_cols))[:, np.newaxis]
+            self._removed[rows, original_cols[rows, seams]] = True
+
+            shift_out_seams(original_cols, seams)
+            self._width -= count
+            return None
+
+        if not self.wants(seam_number, num_seams, count):
+            return None
+
+        # 'visualize' returns a fresh copy, so the image can keep changing while it is written
+        filename = self.filename_pattern.format(seam_number + count)
+        self._writer.submit(visualize(pixels, seam), filename)
+        return filename
+
+    def close(self):
+        """
+        Write the overlay (in 'overlay' mode) and wait for every snapshot to be
+        written.
+
+        """
+
+        if self._writer is None:
+            return
+
+        try:
+            if self.mode == 'overlay':
+                removed = self._removed if self._vertical else self._removed.T
+                overlay = self._original
+                # Vertical seams are drawn in red, horizontal seams in green
+                overlay[removed] = (255, 0, 0) if self._vertical else (0, 255, 0)
+                self._writer.submit(overlay, self.overlay_filename)
+        finally:
+            writer, self._writer = self._writer, None
+            writer.close()
@@ -0,0 +1,408 @@
+"""
+
+Carving images that are larger than memory. The image is decoded once into a raw
+(H, W, 3) buffer on disk, which is memory-mapped, and everything else streams
+through it in strips of rows:
+
+  - the energy of every strip is computed from the strip and the rows above and
+    below it that the energy function looks at (one for the default), and fed
+    straight into the seam search, which only keeps the row of cumulative
+    energies it is working on and the table of back pointers (one byte per
+    pixel),
+  - the seam is removed by reading every strip, dropping the seam from it and
+    writing it back in place, and the energy and seam search of the next seam
+    are done in the same pass,
+  - the result is written out row by row (as PNG or PPM), without ever holding
+    the whole image.
+
+Only vertical seams are removed from the buffer; for horizontal seams it is
+transposed on disk first, block by block.
+
+"""
+
+import argparse
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from energy_image import DEFAULT_ENERGY, ENERGY_DTYPE, add_energy_argument, get_energy_function
+from instrumentation import (CarvingEvent, ObserverGroup, ProgressPrinter, add_observer_arguments,
+                             observer_from_arguments)
+from seam_engine import backtrack, dp_step, remove_seam
+
+
+# The number of rows read, carved and written back at a time
+DEFAULT_STRIP_ROWS = 256
+
+# The size of the blocks a raw buffer is transposed in
+TRANSPOSE_BLOCK = 1024
+
+
+def read_ppm_header(file):
+    """
+    Read the header of a binary PPM (P6) file with 8-bit channels. Returns
+    (width, height, offset), where 'offset' is where the pixel data starts.
+
+    """
+    fields = []
+    token = b''
+    while len(fields) < 4:
+        char = file.read(1)
+        if not char:
+            raise ValueError('The PPM header ends too early')
+        if char == b'#':
+            # A comment runs to the end of the line
+            file.readline()
+        elif char.isspace():
+            if token:
+                fields.append(token)
+                token = b''
+        else:
+            token += char
+
+    if fields[0] != b'P6':
+        raise ValueError(f'Only binary PPM (P6) files can be streamed, not {fields[0]!r}')
+    width, height, maxval = (int(field) for field in fields[1:])
+    if maxval != 255:
+        raise ValueError(f'Only 8-bit PPM files can be streamed, this one has a maximum value of {maxval}')
+
+    return width, height, file.tell()
+
+
+def image_size(image_filename):
+    """
+    The (width, height) of an image file, read from its header only: binary
+    PPM files with 'read_ppm_header', other formats with PIL, which does not
+    decode the pixels for this.
+
+    """
+    with open(image_filename, 'rb') as file:
+        if file.read(2) == b'P6':
+            file.seek(0)
+            return read_ppm_header(file)[:2]
+
+    with Image.open(image_filename) as img:
+        return img.size
+
+
+def check_seam_count(num_seams_to_remove, size, vertical=True):
+    """
+    Raise ValueError unless 'num_seams_to_remove' seams can be removed from an
+    image that is 'size' pixels wide (or high, for horizontal seams): at least
+    one column (or row) has to be left.
+
+    """
+    if not 0 <= num_seams_to_remove < size:
+        raise ValueError(f'Cannot remove {num_seams_to_remove} {"vertical" if vertical else "horizontal"} seams '
+                         f'from an image that is {size} pixels {"wide" if vertical else "high"}')
+
+
+def decode_to_raw(image_filename, raw_filename, strip_rows=DEFAULT_STRIP_ROWS):
+    """
+    Decode the image into a raw (H, W, 3) uint8 file and return it memory-mapped.
+
+    Binary PPM files are copied strip by strip, so they are never held in
+    memory. Other formats are decoded by PIL, which needs the decoded image in
+    memory once (as a compact uint8 buffer) while it is copied to disk.
+
+    """
+    with open(image_filename, 'rb') as file:
+        is_ppm = file.read(2) == b'P6'
+
+    if is_ppm:
+        with open(image_filename, 'rb') as file:
+            width, height, offset = read_ppm_header(file)
+        source = np.memmap(image_filename, dtype=np.uint8, mode='r', offset=offset, shape=(height, width, 3))
+        raw = np.memmap(raw_filename, dtype=np.uint8, mode='w+', shape=(height, width, 3))
+        for start in range(0, height, strip_rows):
+            raw[start:start + strip_rows] = source[start:start + strip_rows]
+        del source
+    else:
+        with Image.open(image_filename) as img:
+            pixels = np.asarray(img.convert('RGB'))
+        raw = np.memmap(raw_filename, dtype=np.uint8, mode='w+', shape=pixels.shape)
+        for start in range(0, len(pixels), strip_rows):
+            raw[start:start + strip_rows] = pixels[start:start + strip_rows]
+        del pixels
+
+    raw.flush()
+    return raw
+
+
+def transpose_raw(raw, raw_filename, width=None, block=TRANSPOSE_BLOCK):
+    """
+    Write the first 'width' columns of the raw buffer transposed (rows and
+    columns swapped) into a new raw file, one block at a time, and return it
+    memory-mapped.
+
+    """
+    rows = raw.shape[0]
+    width = raw.shape[1] if width is None else width
+
+    transposed = np.memmap(raw_filename, dtype=np.uint8, mode='w+', shape=(width, rows, 3))
+    for row in range(0, rows, block):
+        for col in range(0, width, block):
+            col_end = min(col + block, width)
+            transposed[col:col_end, row:row + block] = raw[row:row + block, col:col_end].transpose(1, 0, 2)
+
+    transposed.flush()
+    return transposed
+
+
+def _carve_pass(raw, width, seam, back_pointers, strip_rows, find_next=True, energy_function=DEFAULT_ENERGY):
+    """
+    One streaming pass over the first 'width' columns of the raw buffer: remove
+    'seam' (if given) from every strip in place and, with 'find_next', compute
+    the energy and the seam search of the carved image on the way. Returns the
+    lowest-energy seam of the carved image and its energy, or (None, None).
+
+    """
+    rows = raw.shape[0]
+    energy_function = get_energy_function(energy_function)
+    border = energy_function.radius
+    if seam is not None:
+        width -= 1
+    back_pointers = back_pointers[:, :width]
+
+    # The row of cumulative energies being worked on, and the one before it
+    cost = np.empty(width, dtype=ENERGY_DTYPE)
+    next_cost = np.empty(width, dtype=ENERGY_DTYPE)
+
+    # The last carved rows of the previous strip (twice the radius of the energy function), whose
+    # energy still needs the strip below them
+    context = None
+    # The next row whose energy goes into the seam search
+    row = 0
+
+    for start in range(0, rows, strip_rows):
+        stop = min(start + strip_rows, rows)
+        block = np.array(raw[start:stop, :width + (seam is not None)])
+
+        if seam is not None:
+            block = remove_seam(block, seam[start:stop])
+            raw[start:stop, :width] = block
+
+        if not find_next:
+            continue
+
+        # The rows of this strip, with the rows above it (the 0th row stands in for the
+        # rows above the image) and, for the last strip, the last row again below it
+        parts = [np.repeat(block[:1], border, axis=0) if context is None else context, block]
+        if stop == rows:
+            parts.append(np.repeat(block[-1:], border, axis=0))
+        window = np.concatenate(parts)
+        if len(window) <= 2 * border:
+            # Not enough rows for the energy of any row yet
+            context = window
+            continue
+        context = window[-2 * border:]
+
+        padded = np.pad(energy_function.channels(window), ((0, 0), (border, border), (0, 0)), mode='edge')
+        for energy_line in energy_function(padded):
+            if row == 0:
+                cost[:] = energy_line
+                back_pointers[0] = 0
+            else:
+                dp_step(cost, energy_line, next_cost, back_pointers[row])
+                cost, next_cost = next_cost, cost
+            row += 1
+
+    if not find_next:
+        return None, None
+
+    end_col = int(np.argmin(cost))
+    return backtrack(back_pointers, end_col), int(cost[end_col])
+
+
+def carve_raw(raw, num_seams_to_remove, strip_rows=DEFAULT_STRIP_ROWS, verbose=True, energy_function=DEFAULT_ENERGY,
+              observer=None, vertical=True):
+    """
+    Remove 'num_seams_to_remove' vertical seams from the memory-mapped raw
+    buffer in place, streaming through it once per seam. The carved image is
+    left in the first W - num_seams_to_remove columns of the buffer.
+
+    Every pass is reported to 'observer' (see 'instrumentation') as a 'seam'
+    event, after a 'dp' event for the first seam search, and a line is printed
+    for every seam unless 'verbose' is False. The energy and the seam search
+    are done while the strips are streamed, so they have no events of their
+    own. 'vertical' only tells the events whether the buffer holds the image
+    (True) or its transpose, for horizontal seams.
+
+    Returns the new width and the summed energy of the removed seams, in the
+    given 'energy_function' (see 'energy_image.ENERGY_FUNCTIONS').
+
+    """
+    rows, width = raw.shape[:2]
+    check_seam_count(num_seams_to_remove, width, vertical)
+    back_pointers = np.empty((rows, width), dtype=np.int8)
+    removed_energy = 0
+    observer = ObserverGroup(ProgressPrinter() if verbose else None, observer)
+    clock = time.perf_counter
+
+    def emit(stage, started, seam=None, energy=None):
+        image_rows, image_cols = (rows, width) if vertical else (width, rows)
+        observer(CarvingEvent(stage, seam, 1, num_seams_to_remove, image_rows, image_cols, vertical,
+                              clock() - started, energy, None))
+
+    started = clock()
+    seam, seam_energy = _carve_pass(raw, width, None, back_pointers, strip_rows, num_seams_to_remove > 0,
+                                    energy_function)
+    emit('dp', started)
+    for number in range(num_seams_to_remove):
+        started = clock()
+        removed_energy += seam_energy
+        energy = seam_energy
+        last = number == num_seams_to_remove - 1
+        seam, seam_energy = _carve_pass(raw, width, seam, back_pointers, strip_rows, not last, energy_function)
+        emit('seam', started, number, energy)
+        width -= 1
+
+    raw.flush()
+    return width, removed_energy
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def write_raw_png(raw, width, filename, strip_rows=DEFAULT_STRIP_ROWS):
+    """
+    Write the first 'width' columns of the raw buffer as an RGB PNG, compressing
+    it strip by strip.
+
+    """
+    rows = raw.shape[0]
+    compressor = zlib.compressobj(6)
+
+    with open(filename, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, rows, 8, 2, 0, 0, 0)))
+
+        for start in range(0, rows, strip_rows):
+            block = raw[start:start + strip_rows, :width].reshape(-1, width * 3)
+            # Every row starts with its filter type, 0 (none)
+            lines = np.zeros((len(block), width * 3 + 1), dtype=np.uint8)
+            lines[:, 1:] = block
+            data = compressor.compress(lines.tobytes())
+            if data:
+                file.write(_png_chunk(b'IDAT', data))
+
+        file.write(_png_chunk(b'IDAT', compressor.flush()))
+        file.write(_png_chunk(b'IEND', b''))
+
+
+def write_raw_ppm(raw, width, filename, strip_rows=DEFAULT_STRIP_ROWS):
+    """
+    Write the first 'width' columns of the raw buffer as a binary PPM, strip by
+    strip.
+
+    """
+    rows = raw.shape[0]
+
+    with open(filename, 'wb') as file:
+        file.write(f'P6\n{width} {rows}\n255\n'.encode('ascii'))
+        for start in range(0, rows, strip_rows):
+            file.write(np.ascontiguousarray(raw[start:start + strip_rows, :width]).tobytes())
+
+
+def write_raw_image(raw, width, filename, strip_rows=DEFAULT_STRIP_ROWS):
+    """
+    Write the first 'width' columns of the raw buffer to an image. PNG and PPM
+    files are streamed row by row; any other format is handed to PIL, which
+    needs the whole image in memory.
+
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.png':
+        write_raw_png(raw, width, filename, strip_rows)
+    elif extension in ('.ppm', '.pnm'):
+        write_raw_ppm(raw, width, filename, strip_rows)
+    else:
+        Image.fromarray(np.ascontiguousarray(raw[:, :width]), 'RGB').save(filename)
+
+
+def carve_file(input_filename, output_filename, num_seams_to_remove, vertical=True,
+               strip_rows=DEFAULT_STRIP_ROWS, work_dir=None, verbose=True, energy_function=DEFAULT_ENERGY,
+               observer=None):
+    """
+    Carve an image file into another one without holding either in memory:
+    decode it into a raw buffer in a temporary directory (inside 'work_dir',
+    by default the system's), remove the seams from it and write the result
+    out row by row, with the given 'energy_function'. Every seam is reported
+    to 'observer' (see 'carve_raw'). Returns the summed energy of the removed
+    seams. Raises ValueError, before anything is decoded, when the image is
+    not wide (or high) enough for that many seams.
+
+    """
+    width, height = image_size(input_filename)
+    check_seam_count(num_seams_to_remove, width if vertical else height, vertical)
+
+    scratch = tempfile.mkdtemp(prefix='carve-', dir=work_dir)
+    try:
+        if verbose:
+            print(f'Decoding {input_filename} into a raw buffer...')
+        raw = decode_to_raw(input_filename, os.path.join(scratch, 'image.raw'), strip_rows)
+
+        if not vertical:
+            # Horizontal seams of the image are vertical seams of the transposed buffer
+            raw = transpose_raw(raw, os.path.join(scratch, 'transposed.raw'))
+
+        width, removed_energy = carve_raw(raw, num_seams_to_remove, strip_rows, verbose, energy_function, observer,
+                                          vertical)
+
+        if not vertical:
+            raw = transpose_raw(raw, os.path.join(scratch, 'carved.raw'), width)
+            width = raw.shape[1]
+
+        if verbose:
+            print(f'Writing {output_filename}...')
+        write_raw_image(raw, width, output_filename, strip_rows)
+        del raw
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return removed_energy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Carve an image that does not fit into memory, streaming it from disk.')
+    parser.add_argument('input', help='the input image (binary PPM files are decoded without loading them)')
+    parser.add_argument('output', help='the output image (PNG and PPM files are written row by row)')
+    parser.add_argument('num_seams_to_remove', type=int, help='the number of pixels to remove')
+    parser.add_argument('--height', action='store_true', help='remove horizontal seams (reduce the height) instead')
+    parser.add_argument('--strip-rows', type=int, default=DEFAULT_STRIP_ROWS, metavar='N',
+                        help=f'the number of rows processed at a time (default {DEFAULT_STRIP_ROWS})')
+    parser.add_argument('--work-dir', help='where the raw buffers are kept while carving (default: the temporary directory)')
+    add_energy_argument(parser)
+    add_observer_arguments(parser)
+    args = parser.parse_args()
+
+    if args.strip_rows < 1:
+        parser.error('--strip-rows must be at least 1')
+
+    # Gigapixel images are expected here, so PIL's guard against decompression bombs is lifted
+    Image.MAX_IMAGE_PIXELS = None
+
+    try:
+        width, height = image_size(args.input)
+        check_seam_count(args.num_seams_to_remove, height if args.height else width, not args.height)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    observer, stats = observer_from_arguments(args)
+    carve_file(args.input, args.output, args.num_seams_to_remove, not args.height, args.strip_rows, args.work_dir,
+               not args.quiet, args.energy, observer)
+
+    print(f'Completed finding and removing {args.num_seams_to_remove} {"horizontal" if args.height else "vertical"} seams')
+    print(f'Final Image saved to {args.output}')
+
+    if stats is not None:
+        print(stats.format())
+        stats.save(args.stats)
+        print(f'Stage timings saved to {args.stats}')
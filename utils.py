@@ -1,9 +1,16 @@
 """
 A set of utilities that are helpful for working with images.
 
+Images are represented as contiguous (H, W, 3) uint8 NumPy arrays, where
+the first axis is the row, the second axis is the column and the last axis
+holds the (R, G, B) values. The older representation (a list of rows, where
+each row is a list of `Color` objects) is still accepted by every function
+that takes pixels, and can be produced with `read_image_into_array`.
+
 """
 
 
+import numpy as np
 from PIL import Image
 
 
@@ -24,37 +31,104 @@ class Color:
         return repr(self)
 
 
+def as_pixel_array(pixels):
+    """
+    Return the given pixels as an (H, W, 3) uint8 array. Arrays are returned as
+    they are (no copy is made for uint8 arrays, so transposed views stay
+    views), while the list-of-rows-of-`Color` representation is converted into
+    a contiguous array in a single pass.
+
+    """
+
+    if isinstance(pixels, np.ndarray):
+        return pixels.astype(np.uint8, copy=False)
+
+    return np.array(
+        [[(color.r, color.g, color.b) for color in row] for row in pixels],
+        dtype=np.uint8
+    )
+
+
+def as_color_rows(pixels):
+    """
+    Convert an (H, W, 3) pixel array into the list-of-rows-of-`Color`
+    representation used by older callers.
+
+    """
+
+    return [[Color(*pixel) for pixel in row] for row in np.asarray(pixels).tolist()]
+
+
+def shift_out_seam(array, seam):
+    """
+    Remove a vertical seam (one column per row) from an (H, W, ...) array in
+    place, by shifting the part of every row to the right of the seam one
+    position to the left. Nothing is allocated; the last column is left with
+    stale values, so callers shrink their logical width by one afterwards.
+
+    """
+
+    for row, col in zip(array, np.asarray(seam).tolist()):
+        row[col:-1] = row[col + 1:]
+
+
+def shift_out_seams(array, seams):
+    """
+    Remove several non-overlapping vertical seams, given as an (H, k) array of
+    columns, from an (H, W, ...) array in place. Every row is compacted once,
+    and the last k columns are left with stale values.
+
+    """
+
+    rows, cols = array.shape[:2]
+
+    keep = np.ones((rows, cols), dtype=bool)
+    keep[np.arange(rows)[:, np.newaxis], seams] = False
+
+    for row, row_keep in zip(array, keep):
+        kept = row[row_keep]
+        row[:len(kept)] = kept
+
+
+def read_image(filename):
+    """
+    Read the given image into an (H, W, 3) uint8 array in one bulk operation.
+
+    """
+
+    with Image.open(filename, 'r') as img:
+        return np.array(img.convert('RGB'), dtype=np.uint8)
+
+
+def write_image(pixels, filename):
+    """
+    Write the given (H, W, 3) pixel array (or list of rows of colors) into an
+    image with the given filename in one bulk operation.
+
+    """
+
+    Image.fromarray(as_pixel_array(pixels), 'RGB').save(filename)
+
+
 def read_image_into_array(filename):
     """
     Read the given image into a 2D array of pixels. The result is an array,
     where each element represents a row. Each row is an array, where each
     element is a color.
 
-    """
+    This is kept for list-based callers; new code should use `read_image`.
 
-    img = Image.open(filename, 'r')
-    w, h = img.size
+    """
 
-    pixels = list(Color(*pixel) for pixel in img.getdata())
-    return [pixels[n:(n + w)] for n in range(0, w * h, w)]
+    return as_color_rows(read_image(filename))
 
 
 def write_array_into_image(pixels, filename):
     """
     Write the given 2D array of pixels into an image with the given filename.
-    The input pixels are represented as an array, where each element is a row.
-    Each row is an array, where each element is a color.
+    The input pixels can either be an (H, W, 3) array or a list, where each
+    element is a row and each row is a list of colors.
 
     """
 
-    h = len(pixels)
-    w = len(pixels[0])
-
-    img = Image.new('RGB', (w, h))
-
-    output_pixels = img.load()
-    for y, row in enumerate(pixels):
-        for x, color in enumerate(row):
-            output_pixels[x, y] = (color.r, color.g, color.b)
-
-    img.save(filename)
+    write_image(pixels, filename)